@@ -0,0 +1,21 @@
+import src.estab.block as e_block
+import src.estab.miner as e_miner
+import json, os
+
+if __name__ == "__main__":
+    print(f"[*] backends: {', '.join(e_miner.BACKENDS)}")
+    bits = input(f"Enter bits [{e_block.GENESIS_BITS[:20]}...] by default: ") or e_block.GENESIS_BITS
+    seconds = float(input("Enter seconds per backend [10] by default: ") or 10)
+    workers = int(input(f"Enter number of workers [{os.cpu_count()}] by default: ") or 0) or None
+
+    rates = e_block.bench_mine(bits, seconds, workers=workers)
+    fastest = max(rates, key=rates.get)
+    print(f"[>] fastest backend: {fastest} ({round(rates[fastest])} H/s)")
+
+    if (input("Save it to ./configs/miner_conf.json? [y/N]: ") or "n").lower() == "y":
+        os.makedirs("./configs", exist_ok=True)
+        path = "./configs/miner_conf.json"
+        minerconf = json.load(open(path)) if os.path.exists(path) else {}
+        with open(path, "w") as f:
+            json.dump(minerconf | {"backend": fastest, "workers": workers}, f)
+        print(f"[+] saved")
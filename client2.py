@@ -3,43 +3,142 @@ from src.text_verificator import Hands
 
 from colorama import Fore, Back
 import asyncio
-import time, json, sys, random
+import time, json, sys, random, os
 
 import src.estab.block as e_block
 import src.estab.transaction as e_tran
 import src.estab.verificator as e_ver
+import src.estab.importer as e_importer
 import src.database as db
 
-# function: mine_new_block
-# need: mines new block
-# returns: on success returns new block
-async def mine_new_block(user: User, stop_event: asyncio.Event) -> e_block.Block:
-    print(f"[+] waiting for transactions")
-    while len(user.node.get_mine_transactions()) < e_block.TRANSACTIONS_IN_BLOCK:
-        await asyncio.sleep(0.1) # Waiting for transactions
-    print(f"[+] aquired transactions...")
-    nb = e_block.Block(
-        user.node.get_mine_transactions()[:e_block.TRANSACTIONS_IN_BLOCK]
-    )
+# function: build_template
+# need: builds and signs a candidate block on top of the chain's tip
+# returns: block ready for mining, None if there are not enough transactions
+def build_template(user: User, chain: list[e_block.Block], transactions: list[e_tran.Transaction]) -> e_block.Block | None:
+    if len(transactions) < e_block.TRANSACTIONS_IN_BLOCK:
+        return None
+
+    nb = e_block.Block(transactions[:e_block.TRANSACTIONS_IN_BLOCK])
     nb.make_emission(
-        user.node.blockchain,
+        chain,
         user.node.user.address,
         user.node.user.private_key,
         user.node.user.public_key
     )
 
-    nb.phash = user.node.blockchain[-1].hash 
-    nb.bits = user.node.blockchain[-1].bits
-    nb.bits = nb.calcbits(user.node.blockchain)
+    nb.phash = chain[-1].hash
+    nb.bits = nb.calcbits(chain)
     nb.merkle = nb.merkle_root()
+    return nb
+
+# function: prepare_template
+# need: builds the next candidate block in background, while
+#       the current tip is still being confirmed
+# returns: nothing, template is kept in user.next_template
+async def prepare_template(user: User, chain: list[e_block.Block]):
+    hashes = [t.hash for t in chain[-1].transactions]
+    transactions = [t for t in user.node.get_mine_transactions() if not (t.hash in hashes)]
 
+    user.next_template = await asyncio.get_running_loop().run_in_executor(
+        None, build_template, user, chain, transactions
+    )
+    if user.next_template:
+        print(f"[+] next block template is prepared on top of <{chain[-1].hash}>")
+
+# function: refresh_template
+# need: swaps transactions of the template that have left the pool
+#       for fresh ones, its Merkle tree is updated in place
+# returns: False if the pool has not enough fresh transactions
+def refresh_template(user: User, nb: e_block.Block) -> bool:
+    pool = [t.hash for t in user.node.transactions]
+    stale = [i for i, t in enumerate(nb.transactions) if i > 0 and not (t.hash in pool)]
+    used = [t.hash for t in nb.transactions]
+    fresh = [t for t in user.node.get_mine_transactions() if not (t.hash in used)]
+    if len(fresh) < len(stale):
+        return False
+
+    for i, t in zip(stale, fresh):
+        nb.replace_transaction(i, t)
+    nb.merkle = nb.merkle_root()
+    return True
+
+# function: start_mining
+# need: runs mining of the block in the executor, stop_event stops it
+# returns: future of (stopcode, delta)
+def start_mining(user: User, nb: e_block.Block, stop_event: asyncio.Event) -> asyncio.Future:
     def stop_code():
+        # Called from the mining thread, reading the flag is safe
         return stop_event.is_set()
 
+    print(f"[+] started mining")
+    return asyncio.get_running_loop().run_in_executor(None, nb.mine, stop_code, user.mining_backend, user.mining_workers, user.mining_stats)
+
+# function: drop_next_mining
+# need: stops speculative mining and forgets its template,
+#       when the block it was built on has lost
+# returns: nothing
+async def drop_next_mining(user: User):
+    if user.next_mining:
+        spec_stop, mining = user.next_mining
+        spec_stop.set()
+        await mining # Wait for the workers to be released
+        print(f"[!] speculative mining is discarded")
+    user.next_template, user.next_mining = None, None
+
+# function: mine_new_block
+# need: mines new block
+# returns: on success returns new block, None if mining was stopped
+async def mine_new_block(user: User, stop_event: asyncio.Event) -> e_block.Block | None:
+    nb = user.next_template
+    if nb:
+        # Template is usable only on the same tip, confirmed transactions are swapped for fresh ones
+        pool = [t.hash for t in user.node.transactions]
+        same_tip = nb.phash == user.node.blockchain[-1].hash
+        stale = any(not (t.hash in pool) for t in nb.transactions[1:])
+        if same_tip and stale and user.next_mining:
+            # Speculative mining works on the old header
+            spec_stop, mining = user.next_mining
+            spec_stop.set()
+            await mining
+            user.next_mining = None
+
+        if not same_tip or (stale and not refresh_template(user, nb)):
+            print(f"[!] next block template is outdated")
+            await drop_next_mining(user)
+            nb = None
+        elif stale:
+            print(f"[+] next block template is refreshed with pool transactions")
+
+    mine_stop, mining = user.next_mining or (stop_event, None)
+    user.next_template, user.next_mining = None, None
+
+    if mining:
+        print(f"[+] continuing speculative mining of the prepared template")
+    elif nb:
+        print(f"[+] using prepared block template")
+        nb.timestamp = time.time()
+    else:
+        print(f"[+] waiting for transactions")
+        while len(user.node.get_mine_transactions()) < e_block.TRANSACTIONS_IN_BLOCK:
+            await asyncio.sleep(0.1) # Waiting for transactions
+        print(f"[+] aquired transactions...")
+        nb = await asyncio.get_running_loop().run_in_executor(
+            None, build_template, user, list(user.node.blockchain), user.node.get_mine_transactions()
+        )
+
     # stopcode 0 => stop function worked
     # stopcode 1 => hash was found
-    print(f"[+] started mining")
-    stopcode, delta = nb.mine(stop_code)
+    mining = mining or start_mining(user, nb, mine_stop)
+    try:
+        stopcode, delta = await asyncio.shield(mining)
+    except asyncio.CancelledError:
+        mine_stop.set()
+        await mining # Wait for the workers to be released
+        raise
+
+    if stopcode != 1:
+        print(f"[!] mining was stopped")
+        return None
     print(f"[+] mined new block") 
     nb.hash = nb.hashme()
     print(f"[>>] MINED block hash: {nb.hash}")
@@ -74,19 +173,25 @@ async def update_nodes_count(user: User, stop_event: asyncio.Event):
         await user.upd_nodes_num(nolog=True)
         await asyncio.sleep(3)
 
+async def report_mining_stats(user: User, stop_event: asyncio.Event):
+    while not stop_event.is_set():
+        if user.mining_stats.active:
+            print(f"[*] mining: {user.mining_stats.stringify()}")
+        await asyncio.sleep(10)
+
 async def answer_pending_reqs(user: User, stop_event: asyncio.Event):
     cache_hashes = []
 
     while not stop_event.is_set():
-        preq = await user.check_pending_req(True) # jupdate
-        if preq and not (preq.uuid in cache_hashes):
-            if preq.type == "sync" and preq.entity == "bc": # Syncing blockchain
-                cache_hashes.append(preq.uuid)
-                await user.send_answer(
-                    preq.uuid, [cooked.rawme() for cooked in user.node.blockchain]
-                ) 
+        for preq in await user.check_pending_reqs(True): # jupdate
+            if preq.uuid in cache_hashes or preq.type != "sync":
+                continue
             # Syncing new blocks and transactions
             # is server-side
+            cache_hashes.append(preq.uuid)
+            answer = user.node.answer_request(preq)
+            if answer:
+                await user.send_answer(preq.uuid, answer)
         await asyncio.sleep(2)
 
 async def last_six_sync(user: User):
@@ -100,13 +205,14 @@ async def last_six_sync(user: User):
             raw_blockchain, reason = e_ver.NodeVerificator.fsync_verifacation(answers)
             
             # If user's thread is not most popular or the longest chain - synchronize blockchain 
-            if (reason in ["most_popular", "longest chain"]) and (e_block.Block.cook(raw_blockchain[-1]).hash != user.node.blockchain[-1].hash):
+            if (reason in ["most_popular", "longest chain"]) and (raw_blockchain[-1]["hash"] != user.node.blockchain[-1].hash):
                 print(f"[!] current thread is not the most popular one, re-syncing")
-                print(f"[!] last hashes does not match: {e_block.Block.cook(raw_blockchain[-1]).hash} != {user.node.blockchain[-1].hash}")
-                user.node.blockchain = [
-                    e_block.Block.cook(raw) for raw in raw_blockchain
-                ]
-                user.node.transactions = []
+                print(f"[!] last hashes does not match: {raw_blockchain[-1]["hash"]} != {user.node.blockchain[-1].hash}")
+                s, msg = await user.node.import_chain(raw_blockchain, text_check=user.text_transac_check)
+                if s:
+                    user.node.transactions = []
+                else:
+                    print(f"[!] leading blockchain is invalid, current thread kept: {msg}")
             else:
                 print(f"[$] current thread is the most popular/the longest one")
         else:
@@ -128,8 +234,8 @@ async def work(user: User):
     if len(user.node.blockchain) == 0 or (last_delta > (TIME_DIFF + 1)):
         if (last_delta > (TIME_DIFF + 1)):
             print(f"[!] local blockchain is old ({(last_delta)}s)")
-        print(f"[+] starting full blockchain synchronization")
-        await user.full_bc_sync()
+        print(f"[+] starting blockchain synchronization")
+        await user.header_first_sync()
     
     print(f"[+] new block synchronization")
     await user.new_block_sync()
@@ -153,6 +259,7 @@ async def work(user: User):
 
     for task in pending:
         task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
 
     nb = None
     for task in done:
@@ -168,7 +275,7 @@ async def work(user: User):
             print(f"{Fore.YELLOW}[!] new block was calculated by another node{Fore.RESET}")
         if task is mine_task:
             nb = task.result()
-            print(f"{Fore.CYAN}[*] new block was calculated firstly{Fore.RESET}")
+            if nb: print(f"{Fore.CYAN}[*] new block was calculated firstly{Fore.RESET}")
 
     
     if nb and isinstance(nb, e_block.Block):
@@ -180,6 +287,12 @@ async def work(user: User):
 
         await user.propagate_block(nb)
 
+        # Next block is mined speculatively on top of ours, while other nodes confirm it
+        await prepare_template(user, user.node.blockchain + [nb])
+        if user.next_template:
+            spec_stop = asyncio.Event()
+            user.next_mining = (spec_stop, start_mining(user, user.next_template, spec_stop))
+
         print(f"[%] new block synchronization check")
         
         start = time.time()
@@ -207,8 +320,9 @@ async def work(user: User):
 
         if diff_bc:
             print(f"[$$!] Current blockchain is not leading {leading_phash} != {nb.phash}")
+            await drop_next_mining(user)
             await asyncio.sleep(random.uniform(1, 3))
-            await user.full_bc_sync()
+            await user.header_first_sync()
             user.node.transactions = []
 
             print(f"[+] new blockchain contains: {len(user.node.blockchain)} blocks:\n\t{'\n\t'.join([b.hash for b in user.node.blockchain[::-1][:5]])}")
@@ -257,6 +371,10 @@ async def work(user: User):
                     newt.append(t)
             user.node.transactions = newt
 
+        if user.node.blockchain[-1].hash != nb.hash:
+            # Speculative work was built on the block that lost the tie-break
+            await drop_next_mining(user)
+
     # await last_six_sync(user)
 
     print(f"[+] new blockchain contains: {len(user.node.blockchain)} blocks:\n\t{'\n\t'.join([b.hash for b in user.node.blockchain[::-1][:5]])}")
@@ -280,7 +398,7 @@ async def text_transaction_check(transac: e_tran.Transaction) -> tuple[bool, str
 
 def dump_blockchain(path: str, user: User):
     bdb = db.DataBase(path)
-    bdb.batch_set([(i, block.rawme()) for i, block in enumerate(user.node.blockchain)])
+    bdb.batch_set(list(enumerate(e_block.dump_chain(user.node.blockchain))))
     
     print(f"[+] saved {len(user.node.blockchain)} blocks")
 
@@ -290,11 +408,10 @@ def load_blockchain(path: str, user: User):
         print(f"[+] blockchain's database is empty")
         return
     
-    keys = sorted(bdb.all())
-    for k in keys:
-        user.node.blockchain.append(
-            e_block.Block.cook(bdb.get(k))
-        )
+    keys = sorted(bdb.all(), key=int) # Keys are stored as text, compact keys need block order
+    user.node.blockchain.extend(
+        e_block.cook_chain([bdb.get(k) for k in keys])
+    )
     
     print(f"[+] restored {len(keys)} blocks")
 
@@ -313,8 +430,12 @@ if __name__ == "__main__":
 
     config = json.load(open("./configs/tg_app_conf.json"))
     hands = Hands(verif, config["API_HASH"], config["API_ID"])
-    user = User(pemfile, f"http://{ipconf["serv_ip"]}:{ipconf["serv_port"]}")
+    minerconf = json.load(open("./configs/miner_conf.json")) if os.path.exists("./configs/miner_conf.json") else {}
+    user = User(pemfile, f"http://{ipconf["serv_ip"]}:{ipconf["serv_port"]}", minerconf.get("key_scheme", "rsa"))
     user.set_text_transaction_check(text_transaction_check)
+    user.mining_backend = minerconf.get("backend", user.mining_backend)
+    user.mining_workers = minerconf.get("workers")
+    user.node.checkpoints = e_importer.load_checkpoints("./configs/checkpoints.json")
 
     async def main():
         await hands.connect()
@@ -328,6 +449,7 @@ if __name__ == "__main__":
         asyncio.create_task(answer_pending_reqs(user, stop_transactions))
         asyncio.create_task(sync_new_transactions(user, stop_transactions))
         asyncio.create_task(update_nodes_count(user, stop_transactions))
+        asyncio.create_task(report_mining_stats(user, stop_transactions))
 
         while not stop_transactions.is_set():
             await work(user)
@@ -7,4 +7,8 @@ os.makedirs("./runtime/sessions", exist_ok=True)
 os.makedirs("./configs", exist_ok=True)
 
 with open("./configs/tg_app_conf.json", "w") as f:
-    json.dump({"API_HASH": "", "API_ID": 123}, f)
\ No newline at end of file
+    json.dump({"API_HASH": "", "API_ID": 123}, f)
+with open("./configs/miner_conf.json", "w") as f:
+    json.dump({"backend": "process", "workers": None, "key_scheme": "rsa"}, f)
+with open("./configs/checkpoints.json", "w") as f:
+    json.dump({}, f)
@@ -174,10 +174,12 @@ async def jupdate():
     if len(requests) != 0:
         ruuid = None
         r = None
+        pending = []
         for i in range(len(requests)):
             ruuid = list(requests)[i]
             if requests[ruuid].author != token and not requests[ruuid].immediate_ans:
                 r = requests[ruuid]
+                pending.append(r)
 
         if ruuid is None or r is None:
             return jsonify({
@@ -185,13 +187,22 @@ async def jupdate():
                 "reason": "no requests are available"
             }) 
 
+        # Top-level fields keep the latest request for old clients,
+        # "requests" lets a node answer parallel ones (header-first sync) in one poll
         return jsonify({
             "status": "ok",
             "uuid": r.uuid,
             "timestamp": r.timestamp,
             "type": r.type,
             "entity": r.entity,
-            "body": r.body
+            "body": r.body,
+            "requests": [{
+                "uuid": pr.uuid,
+                "timestamp": pr.timestamp,
+                "type": pr.type,
+                "entity": pr.entity,
+                "body": pr.body
+            } for pr in pending]
         })
 
     alive_nodes[token] = time.time()
@@ -248,6 +259,7 @@ async def update_target():
 
     token = data.get("token")
     upd_target = data.get("target")
+    body = data.get("body", "")
 
     if token is None:      return jsonify({ "status": "fatal-error", "reason": "no token is provided in json data" })
     if upd_target is None: return jsonify({ "status": "fatal-error", "reason": "no update target is provided in json data" })
@@ -266,6 +278,18 @@ async def update_target():
             nr = Request("sync", "newtransac", "", token, True)
             requests[nr.uuid] = nr
 
+        case "txproof":
+            nr = Request("sync", "txproof", body, token)
+            requests[nr.uuid] = nr
+
+        case "headers": # body: block locator
+            nr = Request("sync", "headers", body, token)
+            requests[nr.uuid] = nr
+
+        case "bodies": # body: {"from", "to", "tip": [height, hash]}
+            nr = Request("sync", "bodies", body, token)
+            requests[nr.uuid] = nr
+
         case _:
             return jsonify({
                 "status": "error",
@@ -331,6 +355,7 @@ def clone_miner():
     # Files and directories to include
     include_paths = [
         'client.py',
+        'bench_mine.py',
         'CATME.md',
         'create_runtime.py',
         'transac_creator.py',
@@ -1,3 +1,4 @@
+from collections import Counter, defaultdict
 from typing import Callable
 
 import asyncio
@@ -5,11 +6,15 @@ import aiohttp
 import time, uuid
 
 import src.estab.block as e_block
+import src.estab.importer as e_importer
+import src.estab.miner as e_miner
 import src.estab.transaction as e_tran
 import src.estab.verificator as e_ver
 import src.estab.user as e_user
 
 TIME_DIFF = 30
+BODY_BATCH = 500 # Blocks per body request of the header-first sync
+BODY_RETRIES = 3 # Requests of a body batch before falling back to full sync
 
 class Request:
     def __init__(self, type: str, entity: str, body: str, vuuid: str, timestamp: float):
@@ -20,22 +25,214 @@ class Request:
         self.uuid = vuuid
         self.timestamp = timestamp
 
+class Blockchain(list):
+    """
+    List of blocks with running difficulty statistics: a Counter of
+    targets for every BITS_BLOCKS_CHANGE period. Appending and rolling
+    back the tip update it in place, other edits recount the chain.
+    """
+    def __init__(self, blocks = ()):
+        super().__init__(blocks)
+        self._recount()
+
+    def _recount(self):
+        self.periods: list[Counter] = []
+        for height, block in enumerate(self):
+            self._count(height, block, 1)
+
+    def _count(self, height: int, block: e_block.Block, delta: int):
+        period, target = height // e_block.BITS_BLOCKS_CHANGE, block.target()
+        if period == len(self.periods):
+            self.periods.append(Counter())
+
+        counter = self.periods[period]
+        counter[target] += delta
+        if counter[target] == 0:
+            del counter[target]
+        if not counter:
+            self.periods.pop()
+
+    def period_target(self) -> int | None:
+        """Most frequent target of the current period, None if the period has no blocks yet"""
+        period = len(self) // e_block.BITS_BLOCKS_CHANGE
+        if period >= len(self.periods):
+            return None
+        return self.periods[period].most_common(1)[0][0]
+
+    def append(self, block: e_block.Block):
+        self._count(len(self), block, 1)
+        super().append(block)
+
+    def extend(self, blocks):
+        for block in blocks:
+            self.append(block)
+
+    def __iadd__(self, blocks):
+        self.extend(blocks)
+        return self
+
+    def pop(self, index: int = -1) -> e_block.Block:
+        block = super().pop(index)
+        if index in (-1, len(self)):
+            self._count(len(self), block, -1) # Rollback of the tip
+        else:
+            self._recount()
+        return block
+
+    def __delitem__(self, index):
+        if index == -1 or index == len(self) - 1:
+            self.pop()
+        else:
+            super().__delitem__(index)
+            self._recount()
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self._recount()
+
+    def insert(self, index: int, block: e_block.Block):
+        super().insert(index, block)
+        self._recount()
+
+    def remove(self, block: e_block.Block):
+        super().remove(block)
+        self._recount()
+
+    def clear(self):
+        super().clear()
+        self._recount()
+
 class BlockchainNode:
-    def __init__(self, pem_key: str):
-        self.user = e_user.User(pem_key)
+    def __init__(self, pem_key: str, key_scheme: str = "rsa"):
+        self.user = e_user.User(pem_key, key_scheme)
         
         self.transactions: list[e_tran.Transaction] = []
-        self.blockchain: list[e_block.Block] = []
+        self.blockchain: Blockchain = Blockchain()
+        self.checkpoints: dict[int, str] = {} # Assume-valid {height: hash}, see e_importer.check_chain
+
+    @property
+    def blockchain(self) -> Blockchain:
+        return self._blockchain
+
+    @blockchain.setter
+    def blockchain(self, blocks: list[e_block.Block]):
+        # Plain lists from sync are wrapped, so statistics can't go stale
+        self._blockchain = blocks if isinstance(blocks, Blockchain) else Blockchain(blocks)
+
+    def period_target(self) -> int | None:
+        """Difficulty sanity reference for the next block, O(1)"""
+        return self.blockchain.period_target()
+
+    async def import_chain(self, raw_blocks: list[dict], start: int = 0, text_check: Callable | None = None) -> tuple[bool, str]:
+        """
+        Validates a raw chain (see e_importer.check_chain) and adopts it.
+        start: height raw_blocks start from, local blocks below it are kept
+        text_check: checker of text transactions above the checkpoints
+        Stage 3 replays balances and period difficulty block by block, the
+        local chain is kept if anything fails.
+        """
+        prefix = self.blockchain[:start]
+        blocks, msg = await e_importer.check_chain(raw_blocks, prefix, self.checkpoints, text_check)
+        if blocks is None:
+            return False, msg
+
+        chain = Blockchain(prefix)
+        balances = defaultdict(float)
+        for block in prefix:
+            for t in block.transactions:
+                balances[t.output] += t.amount
+                balances[t.input] -= t.amount
+
+        for height, block in enumerate(blocks, start):
+            if height > 0:
+                low, high = e_block.target_bounds(height, chain[-1].target(), chain.period_target(), block.version)
+                if not low <= block.target() <= high:
+                    return False, f"block {height}: Invalid block bits ({block.bits} is out of {hex(low)}..{hex(high)})"
+
+            for t in block.transactions:
+                # Same as check_balance(): spends are checked against previous blocks only
+                if t.ttype == e_tran.TRANSACTION_TYPE.coin and balances[t.input] < t.amount:
+                    return False, f"block {height}: Invalid transaction: overspending ({t.input}/{t.amount})"
+            for t in block.transactions:
+                balances[t.output] += t.amount
+                balances[t.input] -= t.amount
+            chain.append(block)
+
+        self.blockchain = chain
+        return True, "Ok"
+
+    def locator(self) -> list[str]:
+        """Hashes of the tip, the 10 blocks below it, then every 2^n-th block down to genesis"""
+        hashes, height, step = [], len(self.blockchain) - 1, 1
+        while height > 0:
+            hashes.append(self.blockchain[height].hash)
+            if len(hashes) >= 10:
+                step *= 2
+            height -= step
+        if self.blockchain:
+            hashes.append(self.blockchain[0].hash)
+        return hashes
+
+    def headers_after(self, locator: list[str]) -> dict:
+        """Headers above the highest locator hash found in the chain, all of them if none is found"""
+        heights = {b.hash: h for h, b in enumerate(self.blockchain)}
+        start = next((heights[hsh] + 1 for hsh in locator if hsh in heights), 0)
+        return {
+            "start": start,
+            "headers": [b.header() for b in self.blockchain[start:]]
+        }
+
+    def answer_request(self, req: Request) -> dict | list | None:
+        """Answer body to a sync request of another node, None if there is nothing to send"""
+        try:
+            match req.entity:
+                case "bc":
+                    # Full format, older nodes and the bot can't cook compact chains
+                    return [b.rawme() for b in self.blockchain]
+                case "txproof":
+                    return self.get_transaction_proof(req.body)
+                case "headers":
+                    return self.headers_after(req.body or [])
+                case "bodies":
+                    # Only nodes having the chosen tip answer, bodies of other forks are useless
+                    tip_height, tip_hash = req.body["tip"]
+                    if len(self.blockchain) <= tip_height or self.blockchain[tip_height].hash != tip_hash:
+                        return None
+                    return e_block.dump_chain(self.blockchain[req.body["from"]:req.body["to"]])
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"[!] malformed {req.entity} request <{req.uuid}>: {e}", flush=True)
+        return None
+
+    def find_transaction(self, transac_hash: str) -> tuple[int, int] | None:
+        """Returns: (block height, index in block) or None"""
+        for height in range(len(self.blockchain) - 1, -1, -1):
+            for index, t in enumerate(self.blockchain[height].transactions):
+                if t.hash == transac_hash:
+                    return height, index
+        return None
 
     def check_transaction(self, transac_hash: str) -> tuple[bool, int]:
-        approvoes = 0
-        for block in self.blockchain[::-1]:
-            if transac_hash in [t.hash for t in block.transactions]:
-                return True, approvoes
-
-            approvoes += 1
-        
-        return False, 0
+        found = self.find_transaction(transac_hash)
+        if found is None:
+            return False, 0
+
+        return True, len(self.blockchain) - 1 - found[0]
+
+    def get_transaction_proof(self, transac_hash: str) -> dict | None:
+        """Merkle inclusion proof, checkable with Block.verify_inclusion"""
+        found = self.find_transaction(transac_hash)
+        if found is None:
+            return None
+
+        height, index = found
+        block = self.blockchain[height]
+        return {
+            "hash": transac_hash,
+            "height": height,
+            "confirmations": len(self.blockchain) - 1 - height,
+            "header": block.header(),
+            "proof": block.merkle_tree().proof(index)
+        }
 
     def check_balance(self, address: str) -> float:
         input_balance = 0
@@ -59,8 +256,8 @@ class BlockchainNode:
         return [dct[t] for t in sorted(dct)[::-1]]
     
 class User:
-    def __init__(self, pem_key: str, node_ip: str):
-        self.node = BlockchainNode(pem_key)
+    def __init__(self, pem_key: str, node_ip: str, key_scheme: str = "rsa"):
+        self.node = BlockchainNode(pem_key, key_scheme)
         self.const_node = node_ip
         self.token = ""
         self.text_transac_check = None
@@ -68,6 +265,11 @@ class User:
         self.propagated_block_hashes = []
         self.nodes_num = 0
         self.mined_blocks = 0
+        self.mining_backend = e_miner.DEFAULT_BACKEND
+        self.mining_workers: int | None = None
+        self.mining_stats = e_miner.MiningStats()
+        self.next_template: e_block.Block | None = None
+        self.next_mining: tuple[asyncio.Event, asyncio.Future] | None = None # Speculative mining of next_template
 
     async def upd_nodes_num(self, nolog=False):
         self.nodes_num = await self.num_of_nodes(nolog=nolog)
@@ -107,7 +309,8 @@ class User:
                     raise
         return False, "Network failure"
 
-    async def check_pending_req(self, nolog = False) -> Request | None:
+    async def check_pending_reqs(self, nolog = False) -> list[Request]:
+        """All requests of other nodes pending on the server (one from servers without "requests")"""
         if not nolog: print(f"[+] checking pending requests", flush=True)
         max_retries = 5
         retry_delay = 5
@@ -121,14 +324,16 @@ class User:
 
                         if status:
                             data = await req.json()
-                            if not nolog: print(f"[>] request got:\n\t{data['type']}-{data['entity']}-{data['uuid']}-{data['timestamp']}-{str(data['body']).replace('\\n', ' ')[:50]}", flush=True)
-                            return Request(data["type"], data["entity"], data["body"], data["uuid"], data["timestamp"])
+                            pending = data.get("requests", [data])
+                            for r in pending:
+                                if not nolog: print(f"[>] request got:\n\t{r['type']}-{r['entity']}-{r['uuid']}-{r['timestamp']}-{str(r['body']).replace('\\n', ' ')[:50]}", flush=True)
+                            return [Request(r["type"], r["entity"], r["body"], r["uuid"], r["timestamp"]) for r in pending]
                         elif not msg.startswith("warning"):
                             print(f"[!] couldnt get pending requests", flush=True)
                             raise RuntimeError(f"Couldn't get pending request: {msg}")
                         else:
                             if not nolog: print(f"[$] no pending requests are available", flush=True)
-                            return None
+                            return []
             except (aiohttp.ClientError, asyncio.TimeoutError) as e:
                 print(f"[!] Attempt {attempt + 1} failed: {e}", flush=True)
                 if attempt < max_retries - 1:
@@ -170,12 +375,18 @@ class User:
                                     if status:
                                         data = await req_check.json()
                                         if not nolog: print(f"[>] new blocks are got ({len(data["answers"])})", flush=True)
-                                        answers = [e_block.Block.cook(b) for b in data["answers"]]
+                                        answers = []
+                                        for raw in data["answers"]:
+                                            try:
+                                                answers.append(e_block.Block.cook(raw))
+                                            except (KeyError, TypeError, ValueError, RuntimeError) as e:
+                                                print(f"[!] malformed new block is skipped: {e}", flush=True)
                                         # Check for duplicates
                                         all_cached = True
                                         for b in answers:
                                             # print(f"... [*] looking at <{b.hash}>", flush=True)
-                                            if b.hash in self.new_block_hashes or b.hashme() in [oldb.hash for oldb in self.node.blockchain]:
+                                            # Claimed hash only, hashme() raises for malformed headers; checkme compares them
+                                            if b.hash in self.new_block_hashes or b.hash in [oldb.hash for oldb in self.node.blockchain]:
                                                 continue
                                             
                                             all_cached = False
@@ -289,7 +500,8 @@ class User:
                                             if self.node.check_transaction(t.hash)[0]:
                                                 continue # Skip duplicates
 
-                                            if not (await t.checkme(self.node, len(self.node.blockchain), self.text_transac_check)):
+                                            s, _ = await t.checkme(self.node, len(self.node.blockchain), self.text_transac_check)
+                                            if not s:
                                                 continue # Skip malicious ones
 
                                             self.node.transactions.append(t)
@@ -358,9 +570,12 @@ class User:
                                     i += 1
                             if self_verif and len(answers) != 0: 
                                 raw_blockchain, reason = e_ver.NodeVerificator.fsync_verifacation(answers)
-                                self.node.blockchain = [
-                                    e_block.Block.cook(raw) for raw in raw_blockchain
-                                ]
+                                s, msg = await self.node.import_chain(raw_blockchain, text_check=self.text_transac_check)
+                                if not s:
+                                    print(f"[!] chosen blockchain [{reason}] is invalid: {msg}", flush=True)
+                                    if len(self.node.blockchain) != 0:
+                                        print(f"[!] local version of the blockchain kept ({len(self.node.blockchain)} blocks)", flush=True)
+                                    return
 
                                 print(f"[+] new blockchain [{reason}]: {len(self.node.blockchain)} blocks:\n\t{'\n\t'.join([b.hash for b in self.node.blockchain[::-1][:5]])}", flush=True)
                             elif not self_verif and len(answers) != 0:
@@ -381,6 +596,166 @@ class User:
                 else:
                     raise
 
+    async def request_answers(self, target: str, body = "") -> list:
+        """Sends a sync request through the server and returns the answers of other nodes"""
+        max_retries = 5
+        retry_delay = 5
+        for attempt in range(max_retries):
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.get(f"{self.const_node}/update", json={
+                        "target": target,
+                        "token": self.token,
+                        "body": body
+                    }) as req:
+                        status, msg = await self.check_answer(req)
+
+                        if not status:
+                            print(f"[!] couldn't request {target}:\n\t{msg}", flush=True)
+                            raise RuntimeError(f"Couldn't request {target}: {msg}")
+
+                        data = await req.json()
+                        req_uuid = data["uuid"]
+                        await asyncio.sleep(3) # Wait for the answer
+
+                        async with session.get(f"{self.const_node}/check", json={
+                            "token": self.token,
+                            "uuid": req_uuid
+                        }) as req_check:
+                            status, msg = await self.check_answer(req_check)
+                            if not status:
+                                print(f"[!] couldn't check {target} answers:\n\t{msg}", flush=True)
+                                return []
+
+                            return (await req_check.json())["answers"]
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"[!] Attempt {attempt + 1} failed: {e}", flush=True)
+                if attempt < max_retries - 1:
+                    await asyncio.sleep(retry_delay)
+                else:
+                    raise
+        return []
+
+    async def tx_proof_sync(self, transac_hash: str) -> list[dict]:
+        """
+        Asks other nodes for a Merkle inclusion proof of the transaction.
+        Proofs are checked against headers of the chain we validated (see header_chain),
+        not against headers the answering node sends, so no chain download is needed.
+        Returns: valid proofs, "confirmations" are counted on our header chain
+        """
+        chosen = await self.header_chain()
+        headers = chosen[0] if chosen else [b.header() for b in self.node.blockchain]
+
+        print(f"[+] requesting inclusion proof of <{transac_hash}>", flush=True)
+        answers = await self.request_answers("txproof", transac_hash)
+        proofs = []
+        for p in answers:
+            try:
+                height = p["height"]
+                if p["hash"] != transac_hash or not (isinstance(height, int) and 0 < height < len(headers)):
+                    continue
+                if e_block.Block.verify_inclusion(transac_hash, p["proof"], headers[height], headers[height - 1], height):
+                    proofs.append(p | {"header": headers[height], "confirmations": len(headers) - 1 - height})
+            except (KeyError, TypeError):
+                continue
+        print(f"[>] inclusion proofs: {len(proofs)}/{len(answers)} are valid", flush=True)
+        return proofs
+
+    async def _download_batch(self, start: int, headers: list[dict], tip: list) -> list[dict] | None:
+        """Raw blocks for headers (heights from start), a late answer is requested again"""
+        expected = [h["hash"] for h in headers]
+        for attempt in range(BODY_RETRIES):
+            answers = await self.request_answers("bodies", {"from": start, "to": start + len(headers), "tip": tip})
+            # Any answer matching the chosen headers is good, the import checks the rest
+            body = next((
+                a for a in answers
+                if isinstance(a, list) and all(isinstance(r, dict) for r in a) and [r.get("hash") for r in a] == expected
+            ), None)
+            if body is not None:
+                return body
+            print(f"[!] no bodies for blocks {start}-{start + len(headers) - 1} ({attempt + 1}/{BODY_RETRIES})", flush=True)
+        return None
+
+    async def _download_bodies(self, start: int, headers: list[dict]) -> list[dict] | None:
+        """Raw blocks for headers (heights from start), in parallel BODY_BATCH requests"""
+        tip = [start + len(headers) - 1, headers[-1]["hash"]]
+        batches = range(0, len(headers), BODY_BATCH)
+        bodies = await asyncio.gather(*[
+            self._download_batch(start + b, headers[b:b + BODY_BATCH], tip) for b in batches
+        ])
+        if any(body is None for body in bodies):
+            return None
+        return [raw for body in bodies for raw in body]
+
+    async def header_chain(self) -> tuple[list[dict], str] | None:
+        """
+        Fetches headers above our locator and picks a chain among the
+        valid ones by the same rules as full_bc_sync.
+        Returns: (headers from genesis, reason) or None if no node answers with valid headers
+        """
+        local = [b.header() for b in self.node.blockchain]
+        answers = await self.request_answers("headers", self.node.locator())
+
+        genesis = e_block.Block.gen_genesis().header()
+        candidates = []
+        for a in answers:
+            try:
+                start, headers = a["start"], a["headers"]
+                # No headers above a found locator hash means the node has nothing new
+                if not 0 <= start <= len(local) or (start == 0 and (not headers or headers[0] != genesis)):
+                    continue
+                # Headers are checked on top of the last local block they continue
+                chain = local[:start] + headers
+                s, msg = e_importer.check_checkpoints(chain, self.node.checkpoints)
+                if s:
+                    s, msg = await e_importer.check_headers(chain[max(0, start - 1):], max(0, start - 1))
+            except (KeyError, TypeError, AttributeError):
+                continue
+            if s:
+                candidates.append(chain)
+            else:
+                print(f"[!] invalid header chain: {msg}", flush=True)
+
+        if not candidates:
+            return None
+        return e_ver.NodeVerificator.fsync_verifacation(candidates)
+
+    async def header_first_sync(self) -> bool:
+        """
+        Header-first sync: picks a header chain (see header_chain) and downloads
+        only the bodies we don't have. Falls back to full_bc_sync when no
+        node answers with headers.
+        Returns: True if the local chain is in sync with the chosen one
+        """
+        print(f"[+] starting header-first sync", flush=True)
+        chosen = await self.header_chain()
+        if chosen is None:
+            print(f"[!] no valid headers are got, falling back to full sync", flush=True)
+            await self.full_bc_sync()
+            return False
+
+        local = [b.header() for b in self.node.blockchain]
+        chosen, reason = chosen
+        fork = next((h for h in range(min(len(local), len(chosen))) if local[h]["hash"] != chosen[h]["hash"]), min(len(local), len(chosen)))
+        if fork == len(chosen):
+            print(f"[+] blockchain is up to date [{reason}]: {len(self.node.blockchain)} blocks", flush=True)
+            return True
+
+        print(f"[+] chosen headers [{reason}]: {len(chosen)} blocks, downloading {len(chosen) - fork} from {fork}", flush=True)
+        raw_blocks = await self._download_bodies(fork, chosen[fork:])
+        if raw_blocks is None:
+            print(f"[!] bodies can't be downloaded, falling back to full sync", flush=True)
+            await self.full_bc_sync()
+            return False
+
+        s, msg = await self.node.import_chain(raw_blocks, fork, self.text_transac_check)
+        if not s:
+            print(f"[!] downloaded blocks are invalid: {msg}", flush=True)
+            return False
+
+        print(f"[+] new blockchain [{reason}]: {len(self.node.blockchain)} blocks:\n\t{'\n\t'.join([b.hash for b in self.node.blockchain[::-1][:5]])}", flush=True)
+        return True
+
     async def propagate_block(self, block: e_block.Block):
         print(f"[+] starting block propagation", flush=True)
         print(block.stringify(), flush=True)
@@ -1,7 +1,10 @@
 from collections import Counter
+from functools import lru_cache
 from typing import Callable
 import src.estab.transaction as tr
-import time, hashlib, random, decimal
+import src.estab.merkle as merkle
+import src.estab.miner as miner
+import time, hashlib, decimal, struct, re
 
 def most_frequent(list_):
     counter = Counter(list_)
@@ -12,6 +15,115 @@ BITS_BLOCKS_CHANGE = 2500
 HALVING_BLOCKS = 210_000
 TARGET_SECONDS = 120
 TRANSACTIONS_IN_BLOCK = 5
+GENESIS_BITS = "00ff00000000000000000000000000000000000000000000000000000000000"
+
+BLOCK_VERSION_TEXT = 1   # sha256 of the text header, blocks without "version"
+BLOCK_VERSION_BINARY = 2 # sha256 of HEADER_STRUCT + 4-byte nonce
+BLOCK_VERSION = BLOCK_VERSION_BINARY
+# version, previous hash, merkle root, timestamp, compact bits | nonce
+HEADER_STRUCT = struct.Struct(">I32s32sdI")
+NONCE_STRUCT = struct.Struct(">I")
+HEADER_SIZE = HEADER_STRUCT.size + NONCE_STRUCT.size
+HASH_RE = re.compile(r"[0-9a-f]{64}") # The only forms packed into a binary header
+COMPACT_BITS_RE = re.compile(r"[0-9a-f]{8}")
+
+def local_emission(height: int) -> float:
+    """Emission allowed in the block on height (halving)"""
+    return START_EMISSION / max(1, 2 * max(1, height // HALVING_BLOCKS) if height >= HALVING_BLOCKS else 1)
+
+def target_to_compact(target: int) -> int:
+    """nBits-like form: 1 byte of size, 3 bytes of mantissa"""
+    size = (target.bit_length() + 7) // 8
+    mantissa = target << 8 * (3 - size) if size <= 3 else target >> 8 * (size - 3)
+    if mantissa & 0x800000: # Sign bit is kept clear
+        mantissa >>= 8
+        size += 1
+    return (size << 24) | mantissa
+
+def compact_to_target(compact: int) -> int:
+    size, mantissa = compact >> 24, compact & 0x7fffff
+    return mantissa >> 8 * (3 - size) if size <= 3 else mantissa << 8 * (size - 3)
+
+@lru_cache(maxsize=256)
+def decode_bits(bits: str, version: int = BLOCK_VERSION_TEXT) -> int:
+    """
+    Integer target of bits: full hex for version 1 blocks,
+    8 hex digits of the compact form for version 2.
+    Raises ValueError for malformed bits and non-positive targets
+    """
+    if not isinstance(bits, str):
+        raise ValueError(f"Bits must be a hex string, got {type(bits).__name__}")
+
+    if version == BLOCK_VERSION_TEXT:
+        target = int(bits, 16)
+    else:
+        # Other spellings of the same number would pack into the same header
+        if not COMPACT_BITS_RE.fullmatch(bits):
+            raise ValueError(f"Compact bits must be 8 lowercase hex digits, got \"{bits[:20]}\"")
+        compact = int(bits, 16)
+        if compact & 0x800000:
+            raise ValueError(f"Compact bits {bits} are negative")
+        target = compact_to_target(compact)
+
+    if target <= 0:
+        raise ValueError(f"Bits {bits[:20]} give a non-positive target")
+    return target
+
+def encode_bits(target: int, version: int = BLOCK_VERSION) -> str:
+    """Inverse of decode_bits(), compact form rounds the target down"""
+    if version == BLOCK_VERSION_TEXT:
+        return hex(target)[2:]
+    return f"{target_to_compact(target):08x}"
+
+def period_floor(period_target: int, version: int) -> int:
+    """Lowest target a block of version may have in a period, compact bits can't hold every target and round it down"""
+    return decode_bits(encode_bits(period_target, version), version)
+
+def target_bounds(height: int, prev_target: int, period_target: int | None, version: int) -> tuple[int, int]:
+    """
+    Lowest and highest target calcbits may give a block of version on height:
+    the period target inside a period (the previous one if it's unknown),
+    up to 4 times the previous target either way at a retarget
+    """
+    if height % BITS_BLOCKS_CHANGE != 0:
+        target = period_floor(prev_target if period_target is None else period_target, version)
+        return target, target
+    return period_floor(max(1, prev_target // 4), version), period_floor(prev_target * 4, version)
+
+@lru_cache(maxsize=64)
+def bits_to_target(bits: str, version: int = BLOCK_VERSION_TEXT) -> bytes:
+    """Target as 32-byte big-endian value, comparable with raw sha256 digests"""
+    return min(decode_bits(bits, version), 2**256 - 1).to_bytes(32, "big")
+
+def _hash_to_bytes(hsh: str) -> bytes:
+    """
+    "0" of genesis becomes all zeros, anything else must be 64 lowercase hex digits.
+    Other spellings would pack into the same header, so they raise ValueError
+    """
+    if hsh == "0":
+        return bytes(32)
+    if not HASH_RE.fullmatch(hsh) or hsh == "0" * 64:
+        raise ValueError(f"Hash must be 64 lowercase hex digits, got \"{hsh[:70]}\"")
+    return bytes.fromhex(hsh)
+
+def _bytes_to_hash(data: bytes) -> str:
+    return data.hex() if any(data) else "0"
+
+def unpack_header(data: bytes) -> dict:
+    """Header dict (see Block.header) from HEADER_SIZE bytes of a binary header"""
+    if len(data) != HEADER_SIZE:
+        raise ValueError(f"Block header must be {HEADER_SIZE} bytes, got {len(data)}")
+
+    version, phash, merkle_root, timestamp, compact = HEADER_STRUCT.unpack(data[:HEADER_STRUCT.size])
+    return {
+        "version": version,
+        "timestamp": timestamp,
+        "nonce": NONCE_STRUCT.unpack(data[HEADER_STRUCT.size:])[0],
+        "phash": _bytes_to_hash(phash),
+        "bits": f"{compact:08x}",
+        "hash": hashlib.sha256(data).hexdigest(),
+        "merkle": _bytes_to_hash(merkle_root)
+    }
 
 def elapsed_time(start) -> tuple[tuple[int, int, int, float], float]:
     elapsed = time.time() - start
@@ -22,8 +134,50 @@ def elapsed_time(start) -> tuple[tuple[int, int, int, float], float]:
 
     return (hours, minutes, seconds, milliseconds), elapsed
 
+def bench_mine(bits: str, seconds: float = 10, backends: list[str] | None = None, workers: int | None = None) -> dict[str, float]:
+    """
+    Measures sustained hash rate of mining backends on this machine.
+    Returns: {backend name: H/s}
+    """
+    bench = Block([])
+    bench.phash, bench.merkle, bench.bits = "0", "0", encode_bits(int(bits, 16), bench.version)
+    target = bits_to_target(bench.bits, bench.version)
+
+    rates = {}
+    for name in backends or list(miner.BACKENDS):
+        engine = miner.get_backend(name, workers)
+        hashes, start = 0, time.time()
+        stop = lambda: time.time() - start >= seconds
+
+        while not stop():
+            # Found nonces don't stop the benchmark, the next header is scanned
+            bench.timestamp = time.time()
+            _, n = engine.scan(bench.getblob(), target, stop)
+            hashes += n
+
+        rates[name] = hashes / (time.time() - start)
+        print(f"[+] {name} ({engine.workers} workers): {round(rates[name])} H/s", flush=True)
+
+    return rates
+
+def dump_chain(blocks: list["Block"]) -> list[dict]:
+    """
+    Compact raw chain for sync and storage: a public key is written out
+    the first time it appears, later transactions refer to it by address
+    """
+    known: set[str] = set()
+    return [b.rawme(known) for b in blocks]
+
+def cook_chain(raw_blocks: list[dict]) -> list["Block"]:
+    """Cooks a chain from dump_chain(), full raw blocks are accepted as well"""
+    keys: dict = {}
+    return [Block.cook(raw, keys) for raw in raw_blocks]
+
 class Block:
+    HEADER_FIELDS = ("version", "timestamp", "bits", "phash", "merkle")
+
     def __init__(self, transactions: list[tr.Transaction]):
+        self.version = BLOCK_VERSION
         self.timestamp = time.time()
         self.nonce = 0
         self.phash = "" # Previous hash
@@ -31,10 +185,35 @@ class Block:
         self.merkle = ""
         self.hash = ""
         
-        self.transactions: list[tr.Transaction] = transactions
+        self._merkle_tree: merkle.MerkleTree | None = None
+        self.transactions = transactions
+
+    def __setattr__(self, name, value):
+        # Dirty tracking: changing a hashed field drops the cached blob and hash
+        if name in Block.HEADER_FIELDS:
+            self.__dict__["_blob"] = None
+            self.__dict__["_digest"] = None
+        elif name == "nonce":
+            self.__dict__["_digest"] = None
+        object.__setattr__(self, name, value)
+
+    @property
+    def transactions(self) -> list[tr.Transaction]:
+        return self._transactions
+
+    @transactions.setter
+    def transactions(self, transactions: list[tr.Transaction]):
+        # Tree is built lazily, so set-up steps like make_emission cost nothing
+        self._transactions = transactions
+        self._merkle_tree = None
+
+    def replace_transaction(self, index: int, transaction: tr.Transaction):
+        self._transactions[index] = transaction
+        if self._merkle_tree is not None:
+            self._merkle_tree.replace(index, transaction.hash)
 
     def get_local_emission(self, blockchain: list) -> float:
-        return START_EMISSION / max(1, 2 * max(1, len(blockchain) // HALVING_BLOCKS) if len(blockchain) >= HALVING_BLOCKS else 1)
+        return local_emission(len(blockchain))
 
     def make_emission(self, blockchain: list, address: str, pri_key, pub_key):
         # Halving
@@ -52,21 +231,13 @@ class Block:
         
         self.transactions = [t] + self.transactions
 
-    def merkle_root(self):
-        def hash_pair(a, b): return hashlib.sha256((a + b).encode()).hexdigest()
-
-        hashes = [tx.hash for tx in self.transactions]
-        if not hashes: return ""
+    def merkle_tree(self) -> merkle.MerkleTree:
+        if self._merkle_tree is None:
+            self._merkle_tree = merkle.MerkleTree([tx.hash for tx in self.transactions])
+        return self._merkle_tree
 
-        while len(hashes) > 1:
-            if len(hashes) % 2 == 1:
-                hashes.append(hashes[-1])
-            new_hashes = []
-            for i in range(0, len(hashes), 2):
-                new_hashes.append(hash_pair(hashes[i], hashes[i+1]))
-            hashes = new_hashes
-
-        return hashes[0]
+    def merkle_root(self) -> str:
+        return self.merkle_tree().root()
 
     def stringify(self):
         return f"block: {self.hash}\nphash: {self.phash}\ntime: {self.timestamp}\nnonce: {self.nonce}\nmerkle: {self.merkle}\nbits: {self.bits}\ntransactions:\n\t{'\n\t'.join([
@@ -77,8 +248,9 @@ class Block:
     def gen_genesis():
         genesis = Block([])
         
+        genesis.version = BLOCK_VERSION_TEXT # Never hashed, raw form stays the same
         genesis.phash = "0"
-        genesis.bits  = "00ff00000000000000000000000000000000000000000000000000000000000"
+        genesis.bits  = GENESIS_BITS
         genesis.merkle = "0"
         genesis.nonce = 0
         genesis.hash = "0"
@@ -87,66 +259,140 @@ class Block:
         print(f"[!] genesis block is generated")
         return genesis
 
-    def mine(self, stop_func: Callable = lambda : False) -> tuple[int, float]: # Code of ending, delta
+    def mine(self, stop_func: Callable = lambda : False, backend: str = miner.DEFAULT_BACKEND, workers: int | None = None, stats: miner.MiningStats | None = None) -> tuple[int, float]: # Code of ending, delta
         print(f"[&] starting mining", flush=True)
-        bar = "-\\|/-\\|/"
-        target, blob = int(self.bits, 16), self.getblob()
-        print(f"[+] blob: {blob[:20]}...", flush=True)
+        engine = miner.get_backend(backend, workers)
+        stats = stats or miner.MiningStats()
+        stats.reset(bits_to_target(self.bits, self.version), engine.name)
+        stats.active = True
         print(f"[+] bits: {self.bits[:20]}...", flush=True)
+        print(f"[+] backend: {engine.name} ({engine.workers} workers)", flush=True)
 
-        hash_rate = 0
-        stop_code = 0
-
-        lhashst, start = time.time(), time.time()
-        i, t, hshs, nonce = 0, 0, 0, -1
-        while not stop_func():
-            nonce = random.randint(0, 4294967295)
-            hsh = hashlib.sha256(f"{blob}{nonce}".encode()).hexdigest()
-            hshs += 1
-
-            if time.time() - lhashst >= 10:
-                hash_rate = hshs / (time.time() - lhashst)
-                lhashst = time.time()
-                hshs = 0
-
-            if t % 100000 == 0:
-                (h, m, s, ms), e = elapsed_time(start)
-                print(f"\r[{bar[i % len(bar)]}][{h}h:{m}m][{hash_rate * 0.1} H/s] mining block ({self.bits[:20]}...): {nonce}/{h}/{hsh[:20]}...", end = "", flush=True)
-                i += 1
-            t += 1
-            if int(hsh, 16) < target:
-                stop_code = 1
-                break
-        
-        self.nonce = nonce
-        print(flush=True)
-        return stop_code, time.time() - start
+        done = 0 # Hashes of the previous (rolled) prefixes
+        try:
+            while True:
+                target, blob = stats.target, self.getblob()
+                print(f"[+] header: {blob[:20].hex() if isinstance(blob, bytes) else blob[:20]}...", flush=True)
 
-    def getblob(self) -> str:
-        return f"{self.timestamp}{self.bits}{self.phash}{self.merkle}"
+                nonce, hashes = engine.scan(blob, target, stop_func, lambda h, n: stats.update(done + h))
+                done += hashes
+                stats.update(done)
 
-    def hashme(self) -> str:
-        return hashlib.sha256(f"{self.getblob()}{self.nonce}".encode()).hexdigest()
+                if nonce != -1:
+                    self.nonce = nonce
+                    return 1, stats.job_age()
 
-    def rawme(self) -> dict:
-        if (self.phash == self.hash) and (self.hash != "0"):
-            raise RuntimeError(f"[rawme] Block {self.hash} is self-parented:\n{self.stringify()}\n")
+                if stop_func():
+                    return 0, stats.job_age()
+
+                # Whole nonce space is exhausted: the rolled timestamp gives a new header
+                self.timestamp = max(time.time(), self.timestamp + 0.001)
+                print(f"[+] nonce space is exhausted, timestamp rolled", flush=True)
+        finally:
+            stats.active = False
+            print(f"[+] {stats.stringify()}", flush=True)
+
+    def getblob(self) -> str | bytes:
+        """
+        Hashed header without the nonce: text for version 1,
+        HEADER_STRUCT bytes for version 2.
+        Raises ValueError for a header that can't be encoded
+        """
+        if self._blob is None:
+            if self.version == BLOCK_VERSION_TEXT:
+                self._blob = f"{self.timestamp}{self.bits}{self.phash}{self.merkle}"
+            elif self.version == BLOCK_VERSION_BINARY:
+                self.target() # Malformed bits raise here
+                try:
+                    self._blob = HEADER_STRUCT.pack(
+                        self.version,
+                        _hash_to_bytes(self.phash),
+                        _hash_to_bytes(self.merkle),
+                        self.timestamp,
+                        int(self.bits, 16)
+                    )
+                except (struct.error, TypeError) as e:
+                    raise ValueError(f"Block header can't be packed: {e}")
+            else:
+                raise ValueError(f"Unknown block version {self.version}")
+        return self._blob
+
+    def target(self) -> int:
+        """Raises ValueError for malformed bits"""
+        return decode_bits(self.bits, self.version)
+
+    def header_bytes(self) -> bytes:
+        """Full binary header, HEADER_SIZE bytes. Version 2 only"""
+        blob = self.getblob()
+        if not isinstance(blob, bytes):
+            raise ValueError(f"Block of version {self.version} has no binary header")
+        if type(self.nonce) is not int:
+            raise ValueError(f"Nonce must be an integer, got {type(self.nonce).__name__}")
+        if not 0 <= self.nonce < miner.NONCE_SPACE:
+            raise ValueError(f"Nonce {self.nonce} is out of the 32-bit range")
+        return blob + NONCE_STRUCT.pack(self.nonce)
+
+    def hash_digest(self) -> bytes:
+        if self._digest is None:
+            if self.version == BLOCK_VERSION_TEXT:
+                self._digest = hashlib.sha256(f"{self.getblob()}{self.nonce}".encode()).digest()
+            else:
+                self._digest = hashlib.sha256(self.header_bytes()).digest()
+        return self._digest
+
+    def hashme(self) -> str:
+        return self.hash_digest().hex()
 
-        return {
+    def header(self) -> dict:
+        """rawme() without transactions, enough to check PoW and Merkle proofs"""
+        header = {
             "timestamp": self.timestamp,
             "nonce": self.nonce,
             "phash": self.phash,
             "bits": self.bits,
             "hash": self.hash,
-            "merkle": self.merkle,
-            "transactions": [t.rawme() for t in self.transactions]
+            "merkle": self.merkle
         }
+        if self.version != BLOCK_VERSION_TEXT:
+            header["version"] = self.version # Version 1 blocks keep the old format
+        return header
+
+    @staticmethod
+    def verify_inclusion(tx_hash: str, proof: list, header: dict, prev_header: dict, height: int) -> bool:
+        """
+        Checks that transaction is in the block using only its header.
+        Own bits of a header prove no work, so its target is checked against
+        prev_header (see target_bounds). Both must be taken from a validated
+        header chain, not from the prover.
+        height: height of header
+        """
+        try:
+            block = Block.cook(header | {"transactions": []})
+            prev = Block.cook(prev_header | {"transactions": []})
+            digest = block.hash_digest()
+            if block.hash != digest.hex() or block.phash != prev.hash or digest >= bits_to_target(block.bits, block.version):
+                return False
+            low, high = target_bounds(height, prev.target(), None, block.version)
+            if not low <= block.target() <= high:
+                return False
+        except (KeyError, TypeError, ValueError, RuntimeError):
+            return False
+
+        return merkle.verify_proof(tx_hash, proof, block.merkle)
+
+    def rawme(self, known: set[str] | None = None) -> dict:
+        if (self.phash == self.hash) and (self.hash != "0"):
+            raise RuntimeError(f"[rawme] Block {self.hash} is self-parented:\n{self.stringify()}\n")
+
+        return self.header() | {"transactions": [t.rawme(known) for t in self.transactions]}
     
     def calcbits(self, blockchain: list) -> str:
+        """Bits of this block on top of blockchain, in the format of this block's version"""
+        target = blockchain[-1].target()
         if len(blockchain) % BITS_BLOCKS_CHANGE == 0 and len(blockchain) != 0:
-            minedelta = (time.time() - blockchain[len(blockchain) - BITS_BLOCKS_CHANGE]) / BITS_BLOCKS_CHANGE
-            return hex(round(decimal.Decimal(int(self.bits, 16)) * max(decimal.Decimal(0.25), min(4, decimal.Decimal(TARGET_SECONDS / minedelta)))))[2:]
-        return self.bits
+            minedelta = (time.time() - blockchain[len(blockchain) - BITS_BLOCKS_CHANGE].timestamp) / BITS_BLOCKS_CHANGE
+            target = round(decimal.Decimal(target) * max(decimal.Decimal(0.25), min(4, decimal.Decimal(TARGET_SECONDS / minedelta))))
+        return encode_bits(target, self.version)
     
     async def checkme(self, node, prev_block = None, text_check: Callable | None = None, phash_agrs_check = False, pre_prev_block = None, ignore_phash = False) -> tuple[bool, str]:
         """
@@ -156,23 +402,24 @@ class Block:
         print(f"[?] checking {self.hash[:5]}")
 
         # 0. Проверить сложность на адекватность
-        this_period_blocks = node.blockchain[(BITS_BLOCKS_CHANGE * (len(node.blockchain) // BITS_BLOCKS_CHANGE)):]
-        most_freq = most_frequent([b.bits for b in this_period_blocks])
+        most_freq = node.period_target() # Kept by the node, no scan of the period
 
         if (self.phash == self.hash) and (self.hash != "0"):
             raise RuntimeError(f"[checkme] Block {self.hash} is self-parented:\n{self.stringify()}\n")
 
-        if self.bits < most_freq:
-            return False, f"Invalid block bits (less than most_freq:{most_freq} > {self.bits})"
+        if not self._validate_bits_format():
+            return False, "Invalid bits format"
 
-        # 1. Проверка корректности собственного хеша
-        if self.hash != self.hashme():
-            return False, f"Invalid block hash ({self.hash} != {self.hashme()})\n: {self.stringify()}\nHASH: {self.hashme()}\n\n"
+        # Targets are compared as numbers, bits of different versions and lengths agree
+        if node.blockchain:
+            low, high = target_bounds(len(node.blockchain), node.blockchain[-1].target(), most_freq, self.version)
+            if not low <= self.target() <= high:
+                return False, f"Invalid block bits ({self.bits} is out of {hex(low)}..{hex(high)})"
 
-        # 2. Проверка соответствия хешу сложности
-        target = int(self.bits, 16)
-        if int(self.hash, 16) >= target:
-            return False, f"Hash doesn't meet difficulty target ({self.hash} >= {self.bits})"
+        # 1-2. Хеш и сложность
+        s, msg = self.check_pow()
+        if not s:
+            return False, msg
 
         # 3. Эффективная проверка предыдущего блока
         non_agressive_ok = False
@@ -203,21 +450,15 @@ class Block:
         if s != 4:
             return False, f"Invalid timestamp: code ({s})"
 
-        # 5. Проверка формата bits
-        if not self._validate_bits_format():
-            return False, "Invalid bits format"
-        
         if self.merkle_root() != self.merkle and len(node.blockchain) != 0:
             return False, "Wrong Merkle root"
 
-        emission_n = 0
-        for t in self.transactions:
-            s, msg = await t.checkme(node, len(node.blockchain), text_check)
-            if not s:
-                return False, f"Invalid transaction: {msg}"
-            if t.ttype == tr.TRANSACTION_TYPE.emission:
-                emission_n += 1
-        
+        signatures = await tr.verify_signatures(self.transactions)
+        s, msg = await tr.check_transactions(self.transactions, node, len(node.blockchain), text_check, signatures)
+        if not s:
+            return False, f"Invalid transaction: {msg}"
+
+        emission_n = sum(t.ttype == tr.TRANSACTION_TYPE.emission for t in self.transactions)
         if emission_n != 1:
             return False, f"Invalid emission transactions number ({emission_n})"
 
@@ -234,6 +475,25 @@ class Block:
 
         return True, ("non_agressive_ok" if non_agressive_ok else "Valid block") if not ignored_phash else "ignored_phash"
 
+    def check_pow(self) -> tuple[bool, str]:
+        """Own hash and difficulty target, needs only the header"""
+        if not self._validate_bits_format():
+            return False, "Invalid bits format"
+
+        # 1. Проверка корректности собственного хеша
+        try:
+            digest = self.hash_digest()
+        except ValueError as e:
+            return False, f"Malformed block header ({e})"
+        if self.hash != digest.hex():
+            return False, f"Invalid block hash ({self.hash} != {digest.hex()})\n: {self.stringify()}\nHASH: {digest.hex()}\n\n"
+
+        # 2. Проверка соответствия хешу сложности
+        if digest >= bits_to_target(self.bits, self.version):
+            return False, f"Hash doesn't meet difficulty target ({self.hash} >= {self.bits})"
+
+        return True, "Ok"
+
     def _validate_previous_hash(self, blockchain: list) -> bool:
         """Эффективная проверка предыдущего хеша"""
         if not blockchain:
@@ -262,23 +522,23 @@ class Block:
     def _validate_bits_format(self) -> bool:
         """Проверка формата bits"""
         try:
-            int(self.bits, 16)
+            self.target()
             return True
-            # return len(self.bits) <= 8  # Разумное ограничение
         except ValueError:
             return False
 
     @staticmethod
-    def cook(rawdata: dict):
+    def cook(rawdata: dict, keys: dict | None = None):
         block = Block([])
         
+        block.version = rawdata.get("version", BLOCK_VERSION_TEXT)
         block.timestamp = rawdata["timestamp"]
         block.nonce = rawdata["nonce"]
         block.phash = rawdata["phash"]
         block.bits = rawdata["bits"]
         block.hash = rawdata["hash"]
         block.merkle = rawdata["merkle"]
-        block.transactions = [tr.Transaction.cook(rt) for rt in rawdata["transactions"]]
+        block.transactions = [tr.Transaction.cook(rt, keys) for rt in rawdata["transactions"]]
         
         if (block.phash == block.hash) and block.hash != '0':
             raise RuntimeError(f"[cook] Block {block.hash} is self-parented:\n{block.stringify()}\n")
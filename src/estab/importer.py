@@ -0,0 +1,211 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+import src.estab.block as block
+import src.estab.merkle as merkle
+import src.estab.transaction as tr
+import multiprocessing as mp
+import asyncio, time, json, os
+
+IMPORT_BATCH = 512 # Blocks per process pool task
+
+_import_pool: ProcessPoolExecutor | None = None
+
+def import_pool() -> ProcessPoolExecutor:
+    global _import_pool
+    if _import_pool is None:
+        # Verify and mining threads may already run, fork() of a threaded process may deadlock
+        _import_pool = ProcessPoolExecutor(os.cpu_count() or 1, mp_context=mp.get_context("spawn"))
+    return _import_pool
+
+def load_checkpoints(path: str) -> dict[int, str]:
+    """Checkpoints config: {"height": "block hash"}, no checkpoints if there is no file"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {int(height): hsh for height, hsh in json.load(f).items()}
+
+def check_checkpoints(headers: list[dict], checkpoints: dict[int, str], height: int = 0) -> tuple[bool, str]:
+    """Rejects chains forking off a checkpoint. height: height of headers[0]"""
+    for h, hsh in checkpoints.items():
+        if height <= h < height + len(headers) and headers[h - height]["hash"] != hsh:
+            return False, f"block {h}: Checkpoint mismatch ({headers[h - height]['hash']} != {hsh})"
+    return True, "Ok"
+
+def assume_valid_height(headers: list[dict], checkpoints: dict[int, str], height: int = 0) -> int:
+    """Highest checkpoint the headers reach, -1 if none. Signatures at or below it are assumed valid"""
+    return max([h for h, hsh in checkpoints.items() if height <= h < height + len(headers) and headers[h - height]["hash"] == hsh], default=-1)
+
+def _check_headers(height: int, headers: list[dict]) -> tuple[int, str] | None:
+    """
+    Stage 1 worker: PoW, difficulty and linkage of headers[1:], headers[0]
+    is the already checked previous header, so batches overlap by one.
+    Difficulty follows the previous header (see block.target_bounds): blocks
+    of a period share it, so no period statistics are needed.
+    height: height of headers[0]
+    Returns: (index in the batch, reason) of the first invalid header
+    """
+    try:
+        blocks = [block.Block.cook(h | {"transactions": []}) for h in headers]
+    except (KeyError, TypeError, ValueError, RuntimeError) as e:
+        return 1, f"Malformed block header ({e})"
+
+    for i in range(1, len(blocks)):
+        try:
+            s, msg = blocks[i].check_pow()
+            if not s:
+                return i, msg
+            low, high = block.target_bounds(height + i, blocks[i - 1].target(), None, blocks[i].version)
+            if not low <= blocks[i].target() <= high:
+                return i, f"Invalid block bits ({blocks[i].bits} is out of {hex(low)}..{hex(high)})"
+            if blocks[i].phash != blocks[i - 1].hash:
+                return i, f"Previous hash mismatch ({blocks[i].phash} != {blocks[i - 1].hash})"
+
+            s = blocks[i]._validate_timestamp(blocks[i - 1])
+            if s != 4:
+                return i, f"Invalid timestamp: code ({s})"
+        except TypeError as e: # Fields of a wrong type, e.g. a text timestamp
+            return i, f"Malformed block header ({e})"
+    return None
+
+def _check_merkle(blocks: list[tuple[str, list[str]]]) -> int | None:
+    """Stage 2 worker: (merkle root, transaction hashes) pairs, returns index of the first mismatch"""
+    for i, (root, hashes) in enumerate(blocks):
+        if merkle.MerkleTree(hashes).root() != root:
+            return i
+    return None
+
+async def _run_batches(func, batches: list[tuple]) -> list:
+    """func(*batch) for every batch on the process pool"""
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*[loop.run_in_executor(import_pool(), func, *b) for b in batches])
+
+async def check_headers(raw_blocks: list[dict], height: int = 0) -> tuple[bool, str]:
+    """
+    Stage 1: PoW, difficulty and previous hash links of every header but the first one,
+    on the process pool. The first one is genesis or an already valid block.
+    height: height of the first header (raw blocks work as well)
+    """
+    bad = next((h for h, raw in enumerate(raw_blocks, height) if not isinstance(raw, dict)), None)
+    if bad is not None:
+        return False, f"block {bad}: Malformed block header"
+    headers = [{k: v for k, v in raw.items() if k != "transactions"} for raw in raw_blocks]
+    starts = range(0, len(headers) - 1, IMPORT_BATCH)
+
+    results = await _run_batches(_check_headers, [(height + s, headers[s:s + IMPORT_BATCH + 1]) for s in starts])
+    for start, res in zip(starts, results):
+        if res is not None:
+            return False, f"block {height + start + res[0]}: {res[1]}"
+    return True, "Ok"
+
+def _check_transactions(height: int, b: block.Block, signatures: list[bool | None]) -> tuple[bool, str]:
+    """
+    Block.checkme rules of a block's transactions, without balances and text checks.
+    signatures: results of verify_signatures, or presence of the signature below a checkpoint
+    """
+    if len(b.transactions) <= 1:
+        return False, "Empty transactions block"
+
+    emission_n = 0
+    for t, signature_ok in zip(b.transactions, signatures):
+        if t.hash != t.hashme():
+            return False, f"Hash dismatch of {t.hash}"
+        if t.ttype in [tr.TRANSACTION_TYPE.coin, tr.TRANSACTION_TYPE.emission]:
+            if not signature_ok:
+                return False, f"Signature verification of {t.hash}"
+            if t.amount < 1:
+                return False, f"Negative amount of {t.hash}"
+        if t.ttype == tr.TRANSACTION_TYPE.emission:
+            emission_n += 1
+            if t.amount > block.local_emission(height):
+                return False, f"Invalid transaction: emission overspending ({t.output}/{t.amount})"
+
+    if emission_n != 1:
+        return False, f"Invalid emission transactions number ({emission_n})"
+    return True, "Ok"
+
+async def check_bodies(body: list[block.Block], height: int = 1, assume_valid: int = -1, text_check: Callable | None = None) -> tuple[bool, str]:
+    """
+    Stage 2: Merkle roots on the process pool and signatures of all
+    blocks on the verify pool, both at once. Genesis isn't passed here.
+    height: height of the first block
+    assume_valid: signatures and text transactions of blocks up to this height aren't checked
+    text_check: checker of text transactions above assume_valid, the slowest step, so the last one
+    """
+    starts = range(0, len(body), IMPORT_BATCH)
+    skipped = [t for b in body[:max(0, assume_valid - height + 1)] for t in b.transactions]
+    transactions = [t for b in body[max(0, assume_valid - height + 1):] for t in b.transactions]
+
+    merkle_results, signatures = await asyncio.gather(
+        _run_batches(_check_merkle, [
+            ([(b.merkle, [t.hash for t in b.transactions]) for b in body[s:s + IMPORT_BATCH]],) for s in starts
+        ]),
+        tr.verify_signatures(transactions)
+    )
+    for start, res in zip(starts, merkle_results):
+        if res is not None:
+            return False, f"block {height + start + res}: Wrong Merkle root"
+
+    # Below a checkpoint the signature only has to be present
+    signatures = [bool(t.pub_key and t.signature) if t.ttype != tr.TRANSACTION_TYPE.text else None for t in skipped] + signatures
+    offset = 0
+    for h, b in enumerate(body, height):
+        s, msg = _check_transactions(h, b, signatures[offset:offset + len(b.transactions)])
+        if not s:
+            return False, f"block {h}: {msg}"
+        offset += len(b.transactions)
+
+    texts = [t for b in body[max(0, assume_valid - height + 1):] for t in b.transactions if t.ttype == tr.TRANSACTION_TYPE.text]
+    if text_check and texts:
+        s, msg = await tr.check_transactions(texts, None, height, text_check)
+        if not s:
+            return False, f"Invalid text transaction: {msg}"
+    return True, "Ok"
+
+async def check_chain(raw_blocks: list[dict], prefix: list[block.Block] | None = None, checkpoints: dict[int, str] | None = None, text_check: Callable | None = None) -> tuple[list[block.Block] | None, str]:
+    """
+    Stages 1 and 2 of a chain import, everything that doesn't depend
+    on the state built by previous blocks. Balances and period difficulty
+    are replayed by the node (BlockchainNode.import_chain).
+    prefix: already valid local blocks raw_blocks continue, a full chain if empty
+    checkpoints: {height: hash}, chains forking off them are rejected and
+                 signatures and text transactions up to the highest reached one are assumed valid
+    text_check: checker of text transactions above the checkpoints
+    Returns: (cooked raw_blocks or None, reason)
+    """
+    if not raw_blocks:
+        return None, "Empty blockchain"
+
+    start = time.time()
+    if prefix:
+        headers, height = [prefix[-1].header()] + raw_blocks, len(prefix) - 1
+    else:
+        genesis = block.Block.gen_genesis()
+        if raw_blocks[0] != genesis.rawme():
+            return None, "Genesis block mismatch"
+        headers, height = raw_blocks, 0
+
+    checkpoints = checkpoints or {}
+    s, msg = check_checkpoints(headers, checkpoints, height)
+    if not s:
+        return None, msg
+
+    s, msg = await check_headers(headers, height)
+    if not s:
+        return None, msg
+    print(f"[+] import: {len(raw_blocks)} headers are valid ({round(time.time() - start, 2)}s)", flush=True)
+
+    assume_valid = assume_valid_height(headers, checkpoints, height)
+    if assume_valid >= 0:
+        print(f"[+] import: transactions up to checkpoint {assume_valid} are assumed valid", flush=True)
+
+    try:
+        blocks = block.cook_chain(raw_blocks)
+    except (KeyError, ValueError, RuntimeError) as e:
+        return None, f"Malformed blockchain ({e})"
+
+    s, msg = await check_bodies(blocks if prefix else blocks[1:], len(prefix) if prefix else 1, assume_valid, text_check)
+    if not s:
+        return None, msg
+    print(f"[+] import: Merkle roots and transactions are valid ({round(time.time() - start, 2)}s)", flush=True)
+
+    return blocks, "Ok"
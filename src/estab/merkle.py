@@ -0,0 +1,67 @@
+import hashlib
+
+def hash_pair(a: bytes, b: bytes) -> bytes:
+    return hashlib.sha256(a + b).hexdigest().encode()
+
+class MerkleTree:
+    """
+    Merkle tree over transaction hashes with cached levels.
+    Nodes are kept as encoded hex digests: the root is defined as sha256
+    of two concatenated hex hashes, so this is the cheapest form to pair.
+    An odd node at the end of a level is paired with itself.
+    """
+    def __init__(self, hashes: list[str] | None = None):
+        self.levels: list[list[bytes]] = [[h.encode() for h in hashes or []]]
+        while len(self.levels[-1]) > 1:
+            lvl = self.levels[-1]
+            self.levels.append([
+                hash_pair(lvl[i], lvl[i + 1] if i + 1 < len(lvl) else lvl[i]) for i in range(0, len(lvl), 2)
+            ])
+
+    def __len__(self) -> int:
+        return len(self.levels[0])
+
+    def _update(self, index: int):
+        """Recomputes parents of the leaf on index up to the root, O(log n)"""
+        for depth in range(len(self.levels) - 1):
+            lvl, pi = self.levels[depth], index // 2
+            left = lvl[2 * pi]
+            right = lvl[2 * pi + 1] if 2 * pi + 1 < len(lvl) else left
+            self.levels[depth + 1][pi] = hash_pair(left, right)
+            index = pi
+
+    def replace(self, index: int, tx_hash: str):
+        self.levels[0][index] = tx_hash.encode()
+        self._update(index)
+
+    def proof(self, index: int) -> list[tuple[str, bool]]:
+        """
+        Inclusion proof of the leaf on index.
+        Returns: siblings from the leaf up to the root as (hash, is_left)
+        """
+        path = []
+        for lvl in self.levels[:-1]:
+            sibling = index ^ 1
+            if sibling >= len(lvl):
+                sibling = index # Odd node is paired with itself
+            path.append((lvl[sibling].decode(), sibling < index))
+            index //= 2
+        return path
+
+    def root(self) -> str:
+        if not self.levels[0]:
+            return ""
+        return self.levels[-1][0].decode()
+
+def verify_proof(tx_hash: str, proof: list, root: str) -> bool:
+    """Checks a proof from MerkleTree.proof() against the Merkle root of a block, a malformed proof is invalid"""
+    if not isinstance(proof, list):
+        return False
+
+    node = tx_hash.encode()
+    for step in proof:
+        if not (isinstance(step, (list, tuple)) and len(step) == 2 and isinstance(step[0], str) and isinstance(step[1], bool)):
+            return False
+        sibling, is_left = step
+        node = hash_pair(sibling.encode(), node) if is_left else hash_pair(node, sibling.encode())
+    return node.decode() == root
@@ -0,0 +1,246 @@
+from typing import Callable
+import multiprocessing as mp
+import hashlib, threading, queue, time, os
+
+NONCE_SPACE = 4294967296 # 32-bit nonce
+CHECK_EVERY = 4096       # Hashes between job checks inside a worker
+DEFAULT_BACKEND = "process"
+RATE_WINDOW = 5          # Seconds between hash rate samples
+
+# Workers are started lazily from executor threads, fork() of a threaded process may deadlock
+_mp = mp.get_context("spawn")
+
+def _scan_range(midstate, target: bytes, start: int, end: int, binary: bool = False) -> int:
+    """
+    Scans nonces [start, end) on top of the hashed prefix, returns found nonce or -1.
+    binary: nonce is appended as 4 big-endian bytes instead of decimal text
+    """
+    if binary:
+        for nonce in range(start, end):
+            hsh = midstate.copy()
+            hsh.update(nonce.to_bytes(4, "big"))
+            if hsh.digest() < target: # Both are 32-byte big-endian
+                return nonce
+        return -1
+
+    for nonce in range(start, end):
+        hsh = midstate.copy()
+        hsh.update(str(nonce).encode())
+        if hsh.digest() < target:
+            return nonce
+    return -1
+
+def _midstate(blob: str | bytes):
+    """Hash state after the header prefix, it's copied for every nonce"""
+    return hashlib.sha256(blob if isinstance(blob, bytes) else blob.encode())
+
+def _job_worker(index: int, jobs, results, job_id, counters):
+    """
+    Long-living worker process. Messages in jobs:
+      (job id, blob, target, start, end) - scan nonces [start, end)
+      (job id, None, None, 0, 0)         - stay idle
+      None                               - exit
+    The job is dropped as soon as job_id changes, so a swap costs one batch.
+    """
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+
+        jid, blob, target, start, end = job
+        if blob is None or job_id.value != jid:
+            continue
+
+        midstate, binary = _midstate(blob), isinstance(blob, bytes) # Prefix is hashed only once
+        for batch in range(start, end, CHECK_EVERY):
+            if job_id.value != jid:
+                break
+
+            batch_end = min(batch + CHECK_EVERY, end)
+            nonce = _scan_range(midstate, target, batch, batch_end, binary)
+            counters[index] += (nonce + 1 if nonce != -1 else batch_end) - batch
+            if nonce != -1:
+                results.put((jid, nonce))
+                break
+        else:
+            results.put((jid, -1)) # Slice is exhausted
+
+class MiningJobManager:
+    """
+    Keeps worker processes alive between mining jobs.
+    submit() swaps the template in place: workers drop the old job
+    within one batch, no process startup is paid between blocks.
+    """
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.job_id = None
+        self.processes: list[mp.Process] = []
+
+    def start(self):
+        if self.processes:
+            return
+
+        self.job_id = _mp.Value("q", 0)
+        self.counters = _mp.Array("Q", self.workers, lock=False)
+        self.results = _mp.Queue()
+        self.queues = [_mp.Queue() for _ in range(self.workers)]
+        for i in range(self.workers):
+            p = _mp.Process(target=_job_worker, args=(i, self.queues[i], self.results, self.job_id, self.counters), daemon=True)
+            p.start()
+            self.processes.append(p)
+
+    def submit(self, blob: str | bytes | None, target: bytes | None = None) -> int:
+        """Replaces the current job, blob=None parks the workers. Returns new job id"""
+        self.start()
+        with self.job_id.get_lock():
+            self.job_id.value += 1
+            jid = self.job_id.value
+
+        span = -(-NONCE_SPACE // self.workers) # Disjoint slice for every worker
+        for i, q in enumerate(self.queues):
+            q.put((jid, blob, target, i * span, min((i + 1) * span, NONCE_SPACE)) if blob is not None else (jid, None, None, 0, 0))
+        return jid
+
+    def idle(self):
+        self.submit(None)
+
+    def hashes(self) -> int:
+        return sum(self.counters) if self.processes else 0
+
+    def result(self, timeout: float) -> tuple[int, int] | None:
+        """(job id, found nonce or -1 for an exhausted slice)"""
+        try:
+            return self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        for q in self.queues:
+            q.put(None)
+        for p in self.processes:
+            p.join()
+        self.processes = []
+
+class MiningStats:
+    """
+    Counters of the current mining job.
+    Backends report hashes per batch through update(), so sampling
+    costs nothing inside the hashing loops.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self, target: bytes = b"", backend: str = ""):
+        self.target = target
+        self.backend = backend
+        self.started = time.time()
+        self.hashes = 0
+        self.hash_rate = 0.0
+        self.active = False
+        self._sample_time, self._sample_hashes = self.started, 0
+
+    def update(self, hashes: int):
+        """hashes: total number of hashes done in this job"""
+        self.hashes = hashes
+        now = time.time()
+        if now - self._sample_time >= RATE_WINDOW:
+            self.hash_rate = (hashes - self._sample_hashes) / (now - self._sample_time)
+            self._sample_time, self._sample_hashes = now, hashes
+
+    def job_age(self) -> float:
+        return time.time() - self.started
+
+    def rate(self) -> float:
+        """Last sampled hashes/s, the job average until the first sample"""
+        return self.hash_rate or (self.hashes / max(self.job_age(), 1e-9))
+
+    def expected_time(self) -> float:
+        """Expected seconds to find a block at the current hash rate"""
+        rate = self.rate()
+        if not self.target or rate == 0:
+            return float("inf")
+        return 2**256 / (int.from_bytes(self.target, "big") + 1) / rate
+
+    def stringify(self):
+        return f"[{self.backend}] {round(self.rate())} H/s | {self.hashes} hashes | age: {round(self.job_age(), 1)}s | expected: {round(self.expected_time(), 1)}s"
+
+class MiningBackend:
+    """
+    Interface of a mining backend.
+    scan() walks the nonce space of one header prefix and returns
+    (found nonce or -1, number of hashes done). A bytes prefix is a
+    binary header taking a 4-byte nonce, a str one takes a decimal nonce. stop_func() and
+    progress(hashes, nonce) are called every few thousand hashes.
+    """
+    name = ""
+
+    def __init__(self, workers: int | None = None):
+        self.workers = workers or os.cpu_count() or 1
+
+    def scan(self, blob: str | bytes, target: bytes, stop_func: Callable = lambda : False, progress: Callable | None = None) -> tuple[int, int]:
+        raise NotImplementedError
+
+BACKENDS: dict[str, type[MiningBackend]] = {}
+_instances: dict[tuple[str, int | None], MiningBackend] = {}
+
+def register_backend(cls: type[MiningBackend]) -> type[MiningBackend]:
+    BACKENDS[cls.name] = cls
+    return cls
+
+def get_backend(name: str = DEFAULT_BACKEND, workers: int | None = None) -> MiningBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown mining backend \"{name}\" (available: {', '.join(BACKENDS)})")
+
+    if (name, workers) not in _instances:
+        _instances[(name, workers)] = BACKENDS[name](workers)
+    return _instances[(name, workers)]
+
+@register_backend
+class PythonBackend(MiningBackend):
+    """Single-threaded loop in the calling process"""
+    name = "python"
+
+    def __init__(self, workers: int | None = None):
+        self.workers = 1
+
+    def scan(self, blob: str | bytes, target: bytes, stop_func: Callable = lambda : False, progress: Callable | None = None) -> tuple[int, int]:
+        midstate, binary = _midstate(blob), isinstance(blob, bytes) # Prefix is hashed only once
+        for batch in range(0, NONCE_SPACE, CHECK_EVERY):
+            if progress: progress(batch, batch)
+            if stop_func(): return -1, batch
+
+            nonce = _scan_range(midstate, target, batch, min(batch + CHECK_EVERY, NONCE_SPACE), binary)
+            if nonce != -1:
+                return nonce, nonce + 1
+
+        return -1, NONCE_SPACE
+
+@register_backend
+class ProcessBackend(MiningBackend):
+    """Nonce space split over persistent worker processes"""
+    name = "process"
+
+    def __init__(self, workers: int | None = None):
+        super().__init__(workers)
+        self.jobs = MiningJobManager(self.workers)
+        self._lock = threading.Lock()
+
+    def scan(self, blob: str | bytes, target: bytes, stop_func: Callable = lambda : False, progress: Callable | None = None) -> tuple[int, int]:
+        # Every worker leaves the job as soon as one of them finds a nonce or stop_func fires
+        with self._lock:
+            jid = self.jobs.submit(blob, target)
+            base = self.jobs.hashes()
+            found, exhausted = -1, 0
+            try:
+                while found == -1 and exhausted < self.workers and not stop_func():
+                    res = self.jobs.result(0.05)
+                    if res and res[0] == jid:
+                        if res[1] == -1: exhausted += 1
+                        else: found = res[1]
+
+                    if progress:
+                        progress(self.jobs.hashes() - base, found)
+            finally:
+                self.jobs.idle()
+
+            return found, self.jobs.hashes() - base
@@ -1,17 +1,31 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from typing import Callable
 
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.asymmetric import rsa, padding, ed25519
 from cryptography.hazmat.backends import default_backend
+import asyncio
+import src.estab.user as e_user
 import hashlib
 import base64
 import enum
+import threading
 import time
+import os
 
 START_EMISSION = 100
 BITS_BLOCKS_CHANGE = 20_000
 HALVING_BLOCKS = 540_000
 TARGET_SECONDS = 120
+VERIFIED_CACHE_SIZE = 100_000
+PUBKEY_CACHE_SIZE = 4096
+
+# Signed transaction versions, the version follows the key type
+TX_VERSION_RSA = 1     # RSA-2048 PSS, PEM key (old blocks)
+TX_VERSION_ED25519 = 2 # Ed25519, raw base64 key
+TEXT_CHECK_CONCURRENCY = 8 # Text checks of one block in flight at once
+VERIFY_WORKERS = os.cpu_count() or 1 # Threads of the signature verify pool
 
 def private_serialize(pri_key):
     return pri_key.private_bytes(
@@ -44,7 +58,170 @@ class TRANSACTION_TYPE(enum.Enum):
     text = 1
     emission = 2
 
+def encode_public_key(pub_key) -> str:
+    if isinstance(pub_key, ed25519.Ed25519PublicKey):
+        return base64.b64encode(pub_key.public_bytes(
+            encoding=serialization.Encoding.Raw,
+            format=serialization.PublicFormat.Raw
+        )).decode()
+    return public_serialize(pub_key)
+
+def decode_public_key(pub_key_data: str):
+    if pub_key_data.startswith("-----BEGIN"):
+        return public_deserialize(pub_key_data)
+    return ed25519.Ed25519PublicKey.from_public_bytes(base64.b64decode(pub_key_data))
+
+# Interned public keys: most transactions come from a few miners, so
+# one key object and its PEM are shared by all of their transactions
+_pub_keys: OrderedDict[bytes, object] = OrderedDict() # sha256(PEM) -> key
+_pub_pems: dict[int, tuple[object, str, bytes]] = {}  # id(key) -> (key, PEM, sha256(PEM))
+_pub_addresses: dict[bytes, str] = {}                 # sha256(PEM) -> address
+_pub_lock = threading.Lock()
+
+def _intern_public_key(pub_key, pem: str, digest: bytes):
+    _pub_keys[digest] = pub_key
+    _pub_pems[id(pub_key)] = (pub_key, pem, digest)
+    if len(_pub_keys) > PUBKEY_CACHE_SIZE:
+        old_digest, old = _pub_keys.popitem(last=False)
+        del _pub_pems[id(old)]
+        _pub_addresses.pop(old_digest, None)
+
+def load_public_key(pub_key_data: str):
+    """decode_public_key() through the interned keys cache"""
+    digest = hashlib.sha256(pub_key_data.encode()).digest()
+    with _pub_lock:
+        if digest in _pub_keys:
+            _pub_keys.move_to_end(digest)
+            return _pub_keys[digest]
+
+    pub_key = decode_public_key(pub_key_data)
+    pem = encode_public_key(pub_key) # Canonical form for rawme()
+    with _pub_lock:
+        if digest in _pub_keys:
+            return _pub_keys[digest]
+        _intern_public_key(pub_key, pem, digest)
+    return pub_key
+
+def _public_key_entry(pub_key) -> tuple[object, str, bytes]:
+    with _pub_lock:
+        entry = _pub_pems.get(id(pub_key))
+        if entry is not None and entry[0] is pub_key:
+            return entry
+
+    pem = encode_public_key(pub_key)
+    digest = hashlib.sha256(pem.encode()).digest()
+    with _pub_lock:
+        if digest in _pub_keys:
+            return _pub_pems[id(_pub_keys[digest])]
+        _intern_public_key(pub_key, pem, digest)
+    return pub_key, pem, digest
+
+def dump_public_key(pub_key) -> str:
+    """encode_public_key() through the interned keys cache"""
+    return _public_key_entry(pub_key)[1]
+
+def key_fingerprint(pub_key) -> bytes:
+    return _public_key_entry(pub_key)[2]
+
+def key_address(pub_key) -> str:
+    """public_key_to_address() through the interned keys cache"""
+    digest = key_fingerprint(pub_key)
+    with _pub_lock:
+        if digest in _pub_addresses:
+            return _pub_addresses[digest]
+
+    address = e_user.public_key_to_address(pub_key)
+    with _pub_lock:
+        _pub_addresses[digest] = address
+    return address
+
+# Successful verifications: (tx hash, signature, key fingerprint) -> True
+# Shared by mempool and block validation, so a signature is checked once
+_verified: OrderedDict[tuple[str, str, bytes], bool] = OrderedDict()
+_verified_lock = threading.Lock()
+
+def _is_verified(key: tuple[str, str, bytes]) -> bool:
+    with _verified_lock:
+        if key in _verified:
+            _verified.move_to_end(key)
+            return True
+        return False
+
+def _remember_verified(key: tuple[str, str, bytes]):
+    with _verified_lock:
+        _verified[key] = True
+        if len(_verified) > VERIFIED_CACHE_SIZE:
+            _verified.popitem(last=False)
+
+_verify_pool: ThreadPoolExecutor | None = None
+
+def verify_pool() -> ThreadPoolExecutor:
+    global _verify_pool
+    if _verify_pool is None:
+        _verify_pool = ThreadPoolExecutor(VERIFY_WORKERS, thread_name_prefix="verify")
+    return _verify_pool
+
+def _verify_chunk(transactions: list["Transaction"]) -> list[bool]:
+    return [t.verify_sign(t.pub_key) for t in transactions]
+
+async def verify_signatures(transactions: list["Transaction"]) -> list[bool | None]:
+    """
+    Verifies signatures of a batch of transactions (a block or a whole chain)
+    concurrently on a thread pool, cryptography releases the GIL while verifying.
+    Returns: result for every transaction, None if it carries no signature
+    """
+    loop = asyncio.get_running_loop()
+    signed = [
+        i for i, t in enumerate(transactions)
+        if t.ttype in [TRANSACTION_TYPE.coin, TRANSACTION_TYPE.emission] and t.pub_key and t.signature
+    ]
+    # A few chunks per thread: a whole chain doesn't pay one future per signature
+    size = max(1, -(-len(signed) // (4 * VERIFY_WORKERS)))
+    chunks = [[transactions[i] for i in signed[s:s + size]] for s in range(0, len(signed), size)]
+    checks = await asyncio.gather(*[
+        loop.run_in_executor(verify_pool(), _verify_chunk, chunk) for chunk in chunks
+    ])
+
+    results: list[bool | None] = [None] * len(transactions)
+    for i, ok in zip(signed, [ok for chunk in checks for ok in chunk]):
+        results[i] = ok
+    return results
+
+async def check_transactions(
+        transactions: list["Transaction"],
+        node,
+        block_depth: int = 0,
+        text_check: Callable | None = None,
+        signatures: list[bool | None] | None = None
+) -> tuple[bool, str]:
+    """
+    Transaction.checkme of a whole block at once. Text checks are network
+    round trips, so they overlap under a semaphore; the first failure
+    cancels the checks still in flight.
+    Returns: (all valid, message of the first failure)
+    """
+    semaphore = asyncio.Semaphore(TEXT_CHECK_CONCURRENCY)
+    signatures = signatures or [None] * len(transactions)
+
+    async def check(t: "Transaction", signature_ok: bool | None) -> tuple[bool, str]:
+        async with semaphore:
+            return await t.checkme(node, block_depth, text_check, signature_ok)
+
+    tasks = [asyncio.create_task(check(t, ok)) for t, ok in zip(transactions, signatures)]
+    try:
+        for done in asyncio.as_completed(tasks):
+            s, msg = await done
+            if not s:
+                return False, msg
+        return True, "Ok"
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
 class Transaction:
+    HASHED_FIELDS = ("ttype", "timestamp", "input", "output", "text", "amount")
+
     def __init__(
             self,
             ttype: TRANSACTION_TYPE,
@@ -66,6 +243,20 @@ class Transaction:
         self.hash = ""
         self.signature = ""
 
+    @property
+    def version(self) -> int:
+        return TX_VERSION_ED25519 if isinstance(self.pub_key, ed25519.Ed25519PublicKey) else TX_VERSION_RSA
+
+    def __setattr__(self, name, value):
+        # Dirty tracking: changing a hashed field drops the cached hash
+        if name in Transaction.HASHED_FIELDS:
+            self.__dict__["_hashme"] = None
+        object.__setattr__(self, name, value)
+
+    def signer_address(self) -> str:
+        """Address the signing key belongs to: sender for coins, miner for emission"""
+        return self.input if self.ttype == TRANSACTION_TYPE.coin else self.output
+
     def stringify(self):
         return f"prefix:{self.ttype.value}|{self.input}->{self.output}|{self.amount}|{self.text.replace('\n', '  ')[:50]}|{self.hash[:20]}"
 
@@ -75,16 +266,24 @@ class Transaction:
             return False
 
         try:
+            cache_key = (self.hash, self.signature, key_fingerprint(public_key))
+            if _is_verified(cache_key):
+                return True
+
             signature_bytes = base64.b64decode(self.signature)
-            public_key.verify(
-                signature_bytes,
-                self.hash.encode(),
-                padding.PSS(
-                    mgf=padding.MGF1(hashes.SHA256()),
-                    salt_length=padding.PSS.MAX_LENGTH
-                ),
-                hashes.SHA256()
-            )
+            if isinstance(public_key, ed25519.Ed25519PublicKey):
+                public_key.verify(signature_bytes, self.hash.encode())
+            else:
+                public_key.verify(
+                    signature_bytes,
+                    self.hash.encode(),
+                    padding.PSS(
+                        mgf=padding.MGF1(hashes.SHA256()),
+                        salt_length=padding.PSS.MAX_LENGTH
+                    ),
+                    hashes.SHA256()
+                )
+            _remember_verified(cache_key)
             return True
         except:
             return False
@@ -93,6 +292,9 @@ class Transaction:
         if not private_key:
             return ""
 
+        if isinstance(private_key, ed25519.Ed25519PrivateKey):
+            return base64.b64encode(private_key.sign(self.hash.encode())).decode()
+
         signature = private_key.sign(
             self.hash.encode(),
             padding.PSS(
@@ -104,10 +306,11 @@ class Transaction:
         return base64.b64encode(signature).decode()
 
     def hashme(self) -> str:
-        typesd = {member.name: member.value for member in TRANSACTION_TYPE}
-        return hashlib.sha256(f"{typesd[self.ttype.name]}{self.timestamp}{self.input}{self.output}{self.text}{self.amount}".encode()).hexdigest()
+        if self._hashme is None:
+            self._hashme = hashlib.sha256(f"{self.ttype.value}{self.timestamp}{self.input}{self.output}{self.text}{self.amount}".encode()).hexdigest()
+        return self._hashme
 
-    async def checkme(self, node, block_depth = 0, text_check: Callable | None = None) -> tuple[bool, str]:
+    async def checkme(self, node, block_depth = 0, text_check: Callable | None = None, signature_ok: bool | None = None) -> tuple[bool, str]:
         print(f"[!] checking transaction")
         """Validates the transaction integrity"""
         # Recalculate hash and compare
@@ -127,8 +330,10 @@ class Transaction:
             if self.ttype == TRANSACTION_TYPE.coin and node.check_balance(self.input) < self.amount: 
                 return False, f"Invalid transaction: overspending ({self.input}/{self.amount})"
 
-            print(f"[$] signature verification: {self.verify_sign(self.pub_key)}")
-            return self.verify_sign(self.pub_key), "Signature verification"
+            # signature_ok is given when the signature was checked in a batch
+            verified = self.verify_sign(self.pub_key) if signature_ok is None else signature_ok
+            print(f"[$] signature verification: {verified}")
+            return verified, "Signature verification"
 
         if self.ttype == TRANSACTION_TYPE.emission:
             local_emm = START_EMISSION / max(1, 2 * max(1, block_depth // HALVING_BLOCKS) if block_depth >= HALVING_BLOCKS else 1)
@@ -153,7 +358,11 @@ class Transaction:
         return True, "Ok"
 
     @staticmethod
-    def cook(data: dict):
+    def cook(data: dict, keys: dict | None = None):
+        """
+        keys: address -> public key index of a compact chain (see rawme),
+              keys written out in full are registered in it
+        """
         match data["prefix"]:
             case "0":
                 t = Transaction(
@@ -171,27 +380,38 @@ class Transaction:
                     data["input"], 
                     data["output"],
                     data["timestamp"], 
-                    amount=data["amount"], 
-                    pub_key=public_deserialize(data["pubkey"])
+                    amount=data["amount"]
+                )
+            case _:
+                t = Transaction(
+                    TRANSACTION_TYPE.emission, 
+                    "ECC", 
+                    data["output"],
+                    data["timestamp"], 
+                    amount=data["amount"]
                 )
-                t.hash = data["hash"]
-                t.signature = data["sign"]
-                return t
-            
-        t = Transaction(
-            TRANSACTION_TYPE.emission, 
-            "ECC", 
-            data["output"],
-            data["timestamp"], 
-            amount=data["amount"], 
-            pub_key=public_deserialize(data["pubkey"])
-        )
         t.hash = data["hash"]
         t.signature = data["sign"]
+
+        if "pubkey" in data:
+            t.pub_key = load_public_key(data["pubkey"])
+            if keys is not None and key_address(t.pub_key) == t.signer_address():
+                keys[t.signer_address()] = t.pub_key
+        elif keys is not None and t.signer_address() in keys:
+            t.pub_key = keys[t.signer_address()]
+        else:
+            raise ValueError(f"[cook] Transaction {t.hash} refers to an unknown key of {t.signer_address()}")
+
+        if data.get("version", TX_VERSION_RSA) != t.version:
+            raise ValueError(f"[cook] Transaction {t.hash} has version {data.get('version', TX_VERSION_RSA)}, but its key is of version {t.version}")
         
         return t
 
-    def rawme(self) -> dict:
+    def rawme(self, known: set[str] | None = None) -> dict:
+        """
+        known: addresses whose keys are already written earlier in a compact
+               chain. Such keys are left out and resolved by signer_address()
+        """
         match self.ttype:
             case TRANSACTION_TYPE.text:
                 return {
@@ -203,23 +423,34 @@ class Transaction:
                     "timestamp": self.timestamp
                 }
             case TRANSACTION_TYPE.coin:
-                return {
+                raw = {
                     "prefix": "1",
                     "input": self.input,
                     "output": self.output,
                     "amount": self.amount,
                     "hash": self.hash,
-                    "pubkey": public_serialize(self.pub_key),
+                    "pubkey": dump_public_key(self.pub_key),
                     "sign": self.signature,
                     "timestamp": self.timestamp
                 }
             case TRANSACTION_TYPE.emission:
-                return {
+                raw = {
                     "prefix": "2",
                     "output": self.output,
                     "amount": self.amount,
                     "hash": self.hash,
-                    "pubkey": public_serialize(self.pub_key),
+                    "pubkey": dump_public_key(self.pub_key),
                     "sign": self.signature,
                     "timestamp": self.timestamp
-                }
\ No newline at end of file
+                }
+
+        if self.version != TX_VERSION_RSA:
+            raw["version"] = self.version # RSA transactions keep the old format
+
+        # Only a key that really hashes to the signer's address may be referenced by it
+        if known is not None and key_address(self.pub_key) == self.signer_address():
+            if self.signer_address() in known:
+                del raw["pubkey"]
+            else:
+                known.add(self.signer_address())
+        return raw
@@ -1,14 +1,23 @@
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.asymmetric import rsa, padding, ed25519
 import hashlib
 import base64
 import os
 
-def generate_key_pair():
-    private_key = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=2048
-    )
+KEY_SCHEMES = ["rsa", "ed25519"]
+
+def generate_key_pair(scheme: str = "rsa"):
+    match scheme:
+        case "rsa":
+            private_key = rsa.generate_private_key(
+                public_exponent=65537,
+                key_size=2048
+            )
+        case "ed25519":
+            private_key = ed25519.Ed25519PrivateKey.generate()
+        case _:
+            raise ValueError(f"Unknown key scheme \"{scheme}\" (available: {', '.join(KEY_SCHEMES)})")
+
     public_key = private_key.public_key()
     return private_key, public_key
 
@@ -27,7 +36,8 @@ def public_key_to_address(public_key):
 class User:
     def __init__(
             self,
-            pri_key_path: str
+            pri_key_path: str,
+            key_scheme: str = "rsa" # Only for a new key, existing one is loaded as is
     ):
         if os.path.exists(pri_key_path):
             with open(pri_key_path, "rb") as key_file:
@@ -36,11 +46,12 @@ class User:
                     password = None,
                 )
         else:
-            PRIVATE_KEY, pb = generate_key_pair()
+            PRIVATE_KEY, pb = generate_key_pair(key_scheme)
             with open(pri_key_path, "wb") as f:
                 pem = PRIVATE_KEY.private_bytes(
                     encoding = serialization.Encoding.PEM,
-                    format = serialization.PrivateFormat.TraditionalOpenSSL,
+                    # Traditional OpenSSL format has no Ed25519
+                    format = serialization.PrivateFormat.TraditionalOpenSSL if key_scheme == "rsa" else serialization.PrivateFormat.PKCS8,
                     encryption_algorithm = serialization.NoEncryption()
                 )
                 f.write(pem)
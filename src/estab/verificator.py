@@ -1,5 +1,3 @@
-import src.estab.block as block
-
 class NodeVerificator:
     
     """
@@ -31,12 +29,11 @@ class NodeVerificator:
                 break
         
         if is_all_len_eq:
-            cook = lambda d: block.Block.cook(d)
-
-            lm, ch = cook(blockchain[0][-1]).timestamp, blockchain[0]
+            # Compact chains can't be cooked block by block, raw timestamp is enough
+            lm, ch = blockchain[0][-1]["timestamp"], blockchain[0]
             for i in range(len(blockchain)):
-                if cook(blockchain[i][-1]).timestamp < lm:
-                    lm = cook(blockchain[i][-1]).timestamp
+                if blockchain[i][-1]["timestamp"] < lm:
+                    lm = blockchain[i][-1]["timestamp"]
                     ch = blockchain[i]
             
             return ch, "earliest chain"
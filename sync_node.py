@@ -6,6 +6,7 @@ import time, json
 
 import src.estab.block as e_block
 import src.estab.transaction as e_tran
+import src.estab.importer as e_importer
 import src.database as db
 
 def elapsed_time(start) -> tuple[tuple[int, int, int, int, float], float]:
@@ -21,20 +22,20 @@ def elapsed_time(start) -> tuple[tuple[int, int, int, int, float], float]:
 async def answer_pending_reqs(user: User, stop_event: asyncio.Event):
     cache_hashes = []
     while not stop_event.is_set():
-        preq = await user.check_pending_req(True) # jupdate
-        if preq and not (preq.uuid in cache_hashes):
-            if preq.type == "sync" and preq.entity == "bc": # Syncing blockchain
-                cache_hashes.append(preq.uuid)
-                await user.send_answer(
-                    preq.uuid, [cooked.rawme() for cooked in user.node.blockchain]
-                )
+        for preq in await user.check_pending_reqs(True): # jupdate
+            if preq.uuid in cache_hashes or preq.type != "sync":
+                continue
             # Syncing new blocks and transactions
             # is server-side
+            cache_hashes.append(preq.uuid)
+            answer = user.node.answer_request(preq)
+            if answer:
+                await user.send_answer(preq.uuid, answer)
         await asyncio.sleep(2)
 
 def dump_blockchain(path: str, user: User):
     bdb = db.DataBase(path)
-    bdb.batch_set([(i, block.rawme()) for i, block in enumerate(user.node.blockchain)])
+    bdb.batch_set(list(enumerate(e_block.dump_chain(user.node.blockchain))))
     
     print(f"[+] saved {len(user.node.blockchain)} blocks")
 
@@ -44,11 +45,10 @@ def load_blockchain(path: str, user: User):
         print(f"[+] blockchain's database is empty")
         return
     
-    keys = sorted(bdb.all())
-    for k in keys:
-        user.node.blockchain.append(
-            e_block.Block.cook(bdb.get(k))
-        )
+    keys = sorted(bdb.all(), key=int) # Keys are stored as text, compact keys need block order
+    user.node.blockchain.extend(
+        e_block.cook_chain([bdb.get(k) for k in keys])
+    )
     
     print(f"[+] restored {len(keys)} blocks")
 
@@ -65,6 +65,7 @@ if __name__ == "__main__":
 
     config = json.load(open("./configs/tg_app_conf.json"))
     user = User(pemfile, f"http://{ipconf["serv_ip"]}:{ipconf["serv_port"]}")
+    user.node.checkpoints = e_importer.load_checkpoints("./configs/checkpoints.json")
 
     async def main():
         start = time.time()
@@ -78,7 +79,7 @@ if __name__ == "__main__":
         asyncio.create_task(answer_pending_reqs(user, stop_transactions))
 
         while not stop_transactions.is_set():
-            await user.full_bc_sync()
+            await user.header_first_sync()
             
             (d, h, m, s, ms), alls = elapsed_time(start)            
             print(f"[+] node is up ({d}d {h}h {m}m ({s} seconds))")
@@ -82,11 +82,24 @@ class Updater:
                     return
                 address = spl_t[1]
 
-                await self.current_user().full_bc_sync()
+                await self.current_user().header_first_sync()
 
                 balance = self.current_user().node.check_balance(address)
                 await self.hands.reach_out(chatid, f"__Balance for <{address[:10]}...> is:__ `{balance}`")
 
+            if spl_t[0] == "!check":
+                if len(spl_t) == 1:
+                    await self.hands.reach_out(chatid, "__You need a transaction hash to check it:__ `!check 5c62d1...`")
+                    return
+
+                proofs = await self.current_user().tx_proof_sync(spl_t[1])
+                if not proofs:
+                    await self.hands.reach_out(chatid, f"__Transaction <{spl_t[1][:10]}...> is not confirmed__")
+                    return
+
+                best = max(proofs, key=lambda p: p["confirmations"])
+                await self.hands.reach_out(chatid, f"__Transaction <{spl_t[1][:10]}...> is confirmed in block__ `{best['header']['hash']}` __({best['confirmations']} confirmations)__")
+
             if text == "!sign":
                 if tmsg.reply_to is None:
                     await self.hands.reach_out(chatid, "__Message can not be signed. Reply is empty__")